@@ -0,0 +1,283 @@
+"""End to end pipeline benchmark: echo_all -> download -> upload -> reply, fully offline.
+
+Telegram is replaced by a fake TeleBot that records calls, yt-dlp, gallery-dl and the Instagram embed
+downloader by fakes that write fixture files after a configurable latency. Runs in a temporary directory
+with its own video_ids.db.
+
+Usage: python benchmarks/bench_pipeline.py [requests per workload] [backend latency ms] [telegram latency ms]
+"""
+import itertools
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import telebot  # noqa: E402
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+BACKEND_LATENCY = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+TELEGRAM_LATENCY = (int(sys.argv[3]) if len(sys.argv) > 3 else 10) / 1000
+
+USER_CHATS = range(1000, 1020)  # Replies are queued per chat, requests come from several like in real use
+PHOTO = os.urandom(200 * 1024)
+VIDEO = os.urandom(1024 * 1024)
+
+
+class FakeBot:
+    """Stands in for telebot.TeleBot: answers every send with a fresh file_id and records replies."""
+
+    def __init__(self, token, *args, **kwargs):
+        self.latency = 0.0
+        self.calls = 0
+        self.replies = {}  # message_id replied to -> time of the first reply
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    # Handler registration at import time
+    def message_handler(self, *args, **kwargs):
+        return lambda fn: fn
+
+    callback_query_handler = message_handler
+
+    def register_message_handler(self, *args, **kwargs):
+        pass
+
+    def _send(self, chat_id, media=None, caption=None, reply_to_message_id=None, **kwargs):
+        if hasattr(media, "read"):
+            media.read()  # Like an upload would
+        time.sleep(self.latency)
+
+        file_id = f"file{next(self._ids)}"
+        item = SimpleNamespace(file_id=file_id)
+        with self._cond:
+            self.calls += 1
+            if reply_to_message_id is not None and chat_id in USER_CHATS:
+                self.replies.setdefault(reply_to_message_id, time.perf_counter())
+                self._cond.notify_all()
+        return SimpleNamespace(message_id=next(self._ids), chat=SimpleNamespace(id=chat_id),
+                               photo=[item], video=item, document=item, audio=item)
+
+    def send_photo(self, chat_id, photo=None, caption=None, **kwargs):
+        return self._send(chat_id, photo, caption, **kwargs)
+
+    def send_video(self, chat_id, video=None, caption=None, **kwargs):
+        return self._send(chat_id, video, caption, **kwargs)
+
+    def send_document(self, chat_id, document=None, caption=None, **kwargs):
+        return self._send(chat_id, document, caption, **kwargs)
+
+    def send_audio(self, chat_id, audio=None, caption=None, **kwargs):
+        return self._send(chat_id, audio, caption, **kwargs)
+
+    def send_message(self, chat_id, text=None, **kwargs):
+        return self._send(chat_id, None, text, **kwargs)
+
+    def send_media_group(self, chat_id, media=None, **kwargs):
+        return [self._send(chat_id, None, None, **kwargs) for _ in media]
+
+    def set_message_reaction(self, *args, **kwargs):
+        with self._cond:
+            self.calls += 1
+
+    def delete_message(self, *args, **kwargs):
+        pass
+
+    def wait_for_replies(self, message_ids, timeout: float = 300) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: all(i in self.replies for i in message_ids), timeout)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, statement):
+        with self._lock:
+            self.count += 1
+
+
+class DiskSampler:
+    """Polls the download folders and keeps the peak size."""
+
+    def __init__(self, folders):
+        self.folders = folders
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _size(self) -> int:
+        total = 0
+        for folder in self.folders:
+            for dirpath, _, filenames in os.walk(folder):
+                for name in filenames:
+                    try:
+                        total += os.path.getsize(os.path.join(dirpath, name))
+                    except OSError:
+                        pass  # Deleted while walking
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._size())
+            time.sleep(0.002)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# --- Fake backends, same files and signatures as the real ones ---
+
+def fake_probe(util, url):
+    time.sleep(BACKEND_LATENCY / 5)
+    return util.VideoProbe(util.parse_url(url).post_id, {"duration": 30, "title": "clip"})
+
+
+def fake_video_download(link, path, probe=None):
+    time.sleep(BACKEND_LATENCY)
+    Path(path).write_bytes(VIDEO)
+    return {"title": "clip"}
+
+
+def fake_gallery_download(parsed, folder, max_total=None):
+    time.sleep(BACKEND_LATENCY)
+    folder = Path(folder)
+    for i in range(2):
+        (folder / f"{parsed.post_id}_{i + 1}.jpg").write_bytes(PHOTO)
+    (folder / f"{parsed.post_id}.txt").write_text('{"content": "a post", "selftext": "a post"}')
+
+
+def fake_embed_download(shortcode, folder, max_bytes=None, max_total=None):
+    time.sleep(BACKEND_LATENCY)
+    folder = Path(folder)
+    for i in range(3):
+        (folder / f"{shortcode}{i}.webp").write_bytes(PHOTO)
+    return "a caption"
+
+
+# --- Workloads ---
+
+_post_ids = itertools.count(10 ** 18)
+
+
+def new_url() -> str:
+    n = next(_post_ids)
+    kind = n % 4
+    if kind == 0:
+        return f"https://www.youtube.com/watch?v={n % 10 ** 11:011d}"
+    if kind == 1:
+        return f"https://www.instagram.com/p/{n % 10 ** 11:011d}/"
+    if kind == 2:
+        return f"https://x.com/someone/status/{n}"
+    return f"https://www.reddit.com/r/pics/comments/{n % 36 ** 6:x}/title/"
+
+
+def cache_hit_heavy(warm_urls):
+    return [random.choice(warm_urls) if random.random() < 0.9 else new_url() for _ in range(REQUESTS)]
+
+
+def cache_miss_heavy(warm_urls):
+    return [new_url() for _ in range(REQUESTS)]
+
+
+def burst(warm_urls):
+    # The same few new posts requested ten times each, all at once
+    posts = [new_url() for _ in range(max(1, REQUESTS // 10))]
+    return [posts[i % len(posts)] for i in range(REQUESTS)]
+
+
+def run(main, bot, queries, urls):
+    message_ids = []
+    sent_at = {}
+    queries_before = queries.count
+    start = time.perf_counter()
+
+    with DiskSampler(["scratch"]) as disk:
+        for url in urls:
+            message_id = next(bot._ids)
+            chat = SimpleNamespace(id=USER_CHATS[message_id % len(USER_CHATS)], type="private")
+            message = SimpleNamespace(text=f"look {url}", chat=chat, id=message_id, message_id=message_id)
+            sent_at[message_id] = time.perf_counter()
+            message_ids.append(message_id)
+            main.echo_all(message)
+
+        if not bot.wait_for_replies(message_ids):
+            print("timed out waiting for replies")
+        end = time.perf_counter()
+
+    latencies = sorted(bot.replies[i] - sent_at[i] for i in message_ids if i in bot.replies)
+    return {
+        "req/s": len(urls) / (end - start),
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p99 ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "queries/req": (queries.count - queries_before) / len(urls),
+        "peak disk MB": disk.peak / 1024 / 1024,
+    }
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="torodl-bench-")
+    shutil.copytree(ROOT / "img", Path(workdir, "img"))
+    os.chdir(workdir)
+    os.environ.update(BOT_TOKEN="123:fake", PRIVATE_CHANNEL_ID="-100", ADMIN_USER_ID="1",
+                      METRICS_PORT="0", KEEP_VIDEO_AUDIO="false")
+
+    import dbtools
+    queries = QueryCounter()
+    connect = dbtools._connect
+
+    def counted_connect(path):
+        connection = connect(path)
+        connection.set_trace_callback(queries)
+        return connection
+
+    with mock.patch.object(telebot, "TeleBot", FakeBot), mock.patch.object(dbtools, "_connect", counted_connect):
+        import main as bot_main
+        import ig_extractor
+        import toolbox as util
+
+        logging.getLogger().setLevel(logging.WARNING)
+        bot = bot_main.bot
+
+        with mock.patch.object(util, "probe_video", lambda url: fake_probe(util, url)), \
+                mock.patch.object(util, "download_video", fake_video_download), \
+                mock.patch.object(util, "download_video_720", fake_video_download), \
+                mock.patch.object(util, "download_media", fake_gallery_download), \
+                mock.patch.object(ig_extractor, "download_media_embed", fake_embed_download):
+            # Posts that are already in the DB for the cache hit workload
+            warm_urls = [new_url() for _ in range(max(4, REQUESTS // 10))]
+            run(bot_main, bot, queries, warm_urls)
+            bot.latency = TELEGRAM_LATENCY
+
+            print(f"{REQUESTS} requests per workload, backend {BACKEND_LATENCY * 1000:.0f} ms, "
+                  f"Telegram {TELEGRAM_LATENCY * 1000:.0f} ms, {bot_main.DOWNLOAD_WORKERS} workers")
+            print(f"{'workload':<18}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'queries/req':>13}{'peak disk MB':>14}")
+            for workload in [cache_hit_heavy, cache_miss_heavy, burst]:
+                result = run(bot_main, bot, queries, workload(warm_urls))
+                print(f"{workload.__name__:<18}{result['req/s']:>10.1f}{result['p50 ms']:>10.1f}"
+                      f"{result['p99 ms']:>10.1f}{result['queries/req']:>13.2f}{result['peak disk MB']:>14.1f}")
+
+        bot_main.download_scheduler.shutdown(wait=True)
+
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
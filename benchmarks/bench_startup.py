@@ -0,0 +1,103 @@
+"""Startup benchmark: time from `import main` to ready, with a fresh DB and with the asset file_ids stored.
+
+Each run is a fresh interpreter in a temporary directory, Telegram is replaced by a fake TeleBot whose uploads
+take a configurable latency. Also reports which heavy modules the import pulled in.
+
+Target: a warm start (assets already in the DB) under 1 s and with no uploads at all. The time includes the version
+logging the entry point does at boot.
+
+Usage: python benchmarks/bench_startup.py [runs] [upload latency ms]
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+UPLOAD_LATENCY = (int(sys.argv[2]) if len(sys.argv) > 2 else 500) / 1000
+
+TARGET_SECONDS = 1.0
+
+# Runs in the child interpreter, prints a JSON line with the results
+CHILD = """
+import itertools, json, sys, time
+start = time.perf_counter()
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, {root!r})
+import telebot
+
+class FakeBot:
+    def __init__(self, token, *args, **kwargs):
+        self.token = token
+        self.uploads = 0
+        self._ids = itertools.count(1)
+
+    def message_handler(self, *args, **kwargs):
+        return lambda fn: fn
+
+    callback_query_handler = message_handler
+
+    def register_message_handler(self, *args, **kwargs):
+        pass
+
+    def _upload(self, *args, **kwargs):
+        time.sleep({latency})
+        self.uploads += 1
+        item = SimpleNamespace(file_id=f"file{{next(self._ids)}}")
+        return SimpleNamespace(photo=[item], document=item)
+
+    send_photo = send_document = _upload
+
+with mock.patch.object(telebot, "TeleBot", FakeBot):
+    import main
+main.log_versions()  # What the entry point does before it starts polling
+
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "uploads": main.bot.uploads,
+    "yt_dlp": "yt_dlp" in sys.modules,
+    "gallery_dl": "gallery_dl" in sys.modules,
+}}))
+"""
+
+
+def run_once(workdir: str) -> dict:
+    env = dict(os.environ, BOT_TOKEN="123:fake", PRIVATE_CHANNEL_ID="-100", ADMIN_USER_ID="1", METRICS_PORT="0")
+    code = CHILD.format(root=str(ROOT), latency=UPLOAD_LATENCY)
+    result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    cold, warm = [], []
+    for _ in range(RUNS):
+        workdir = tempfile.mkdtemp(prefix="torodl-startup-")
+        shutil.copytree(ROOT / "img", Path(workdir, "img"))
+        try:
+            cold.append(run_once(workdir))  # Fresh video_ids.db
+            warm.append(run_once(workdir))  # Same DB, file_ids stored by the cold start
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{RUNS} runs, upload latency {UPLOAD_LATENCY * 1000:.0f} ms, target {TARGET_SECONDS:.1f} s warm")
+    print(f"{'start':<8}{'median s':>10}{'max s':>10}{'uploads':>10}{'yt_dlp':>8}{'gallery_dl':>12}")
+    for name, results in [("cold", cold), ("warm", warm)]:
+        seconds = [r["seconds"] for r in results]
+        print(f"{name:<8}{statistics.median(seconds):>10.3f}{max(seconds):>10.3f}{results[-1]['uploads']:>10}"
+              f"{str(results[-1]['yt_dlp']):>8}{str(results[-1]['gallery_dl']):>12}")
+
+    warm_median = statistics.median(r["seconds"] for r in warm)
+    print("target met" if warm_median < TARGET_SECONDS and not warm[-1]["uploads"] else "target missed")
+
+
+if __name__ == "__main__":
+    main()
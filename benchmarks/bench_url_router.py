@@ -0,0 +1,84 @@
+"""Compares toolbox.parse_url against the old per-function URL helpers.
+
+Usage: python benchmarks/bench_url_router.py [number of URLs]
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import toolbox as util  # noqa: E402
+
+SUPPORTED = [
+    "https://www.youtube.com/watch?v={yt}&list=RDMM&start_radio=1",
+    "https://youtu.be/{yt}?si=abcdef",
+    "https://www.youtube.com/shorts/{yt}",
+    "https://x.com/someone/status/{num}?s=20",
+    "https://twitter.com/someone/status/{num}",
+    "https://www.tiktok.com/@someone/video/{tt}",
+    "https://vm.tiktok.com/ZNTqk1FHe",
+    "https://www.instagram.com/p/{ig}/?igsh=abc",
+    "https://www.instagram.com/reel/{ig}/",
+    "https://www.reddit.com/r/pics/comments/{rd}/some_title/",
+    "https://danbooru.donmai.us/posts/{num}?q=tag",
+    "https://safebooru.org/index.php?page=post&s=view&id={num}",
+]
+
+# What most group messages with links look like: nothing we support
+UNSUPPORTED = [
+    "https://www.google.com/search?q={num}",
+    "https://github.com/someone/repo/issues/{num}",
+    "https://en.wikipedia.org/wiki/Special:Random/{num}",
+    "https://open.spotify.com/track/{ig}",
+    "https://www.twitch.tv/someone/clip/{ig}",
+]
+
+
+def make_corpus(size: int, seed: int = 1):
+    rng = random.Random(seed)
+    chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-"
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(SUPPORTED if rng.random() < 0.3 else UNSUPPORTED)
+        corpus.append(template.format(
+            yt="".join(rng.choice(chars) for _ in range(11)),
+            ig="".join(rng.choice(chars) for _ in range(11)),
+            tt=str(rng.randrange(10 ** 18, 10 ** 19)),
+            rd="".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(7)),
+            num=rng.randrange(1, 10 ** 9),
+        ))
+    return corpus
+
+
+def legacy(url: str):
+    """What main.py used to run for every message with a link."""
+    if util.check_if_mp4_url(url):
+        return None
+    if not util.validate_url(url):
+        return None
+    platform_id = util.get_platform_video_id(url)
+    platform = util.get_platform(url)
+    filename = util.get_filename(url, "mp4")
+    return platform, platform_id, filename
+
+
+def routed(url: str):
+    parsed = util.parse_url(url)
+    if parsed is None or parsed.kind == "direct":
+        return None
+    return parsed.platform, parsed.post_id, util.get_parsed_filename(parsed, "mp4")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    corpus = make_corpus(size)
+
+    for name, fn in [("legacy helpers", legacy), ("parse_url", routed)]:
+        best = min(timeit.repeat(lambda: [fn(u) for u in corpus], number=1, repeat=5))
+        print(f"{name:15s} {best * 1000:8.1f} ms  {size / best:12,.0f} URLs/s  {best / size * 1e6:6.2f} us/URL")
+
+
+if __name__ == "__main__":
+    main()
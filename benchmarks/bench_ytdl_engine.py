@@ -0,0 +1,79 @@
+"""Repeated yt-dlp probes: a new YoutubeDL per call (the old way) against the warm YtdlEngine.
+
+Runs offline against a local HTTP server by default, pass a URL to probe a real site instead.
+Usage: python benchmarks/bench_ytdl_engine.py [probes] [url]
+"""
+import http.server
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yt_dlp  # noqa: E402
+
+import ytdl_engine  # noqa: E402
+
+OPTIONS = {"quiet": True, "no_warnings": True}
+
+
+def serve_fixture(directory: str) -> http.server.ThreadingHTTPServer:
+    Path(directory, "clip.mp4").write_bytes(b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 4096)
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse shows up
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(http.server.ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass  # yt-dlp drops the connection once it has seen the headers
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def cold(url: str, probes: int):
+    for _ in range(probes):
+        with yt_dlp.YoutubeDL(dict(OPTIONS)) as ydl:
+            ydl.extract_info(url, download=False, process=False)
+
+
+def warm(url: str, probes: int):
+    engine = ytdl_engine.YtdlEngine({"probe": dict(OPTIONS)})
+    for _ in range(probes):
+        with engine.checkout("probe") as ydl:
+            ydl.extract_info(url, download=False, process=False)
+    engine.close()
+
+
+def main():
+    probes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    url = sys.argv[2] if len(sys.argv) > 2 else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        if url is None:
+            server = serve_fixture(tmp)
+            url = f"http://127.0.0.1:{server.server_address[1]}/clip.mp4"
+
+        for name, fn in [("new YoutubeDL", cold), ("warm engine", warm)]:
+            fn(url, 1)  # Imports and extractor class loading shouldn't count
+            start = time.perf_counter()
+            fn(url, probes)
+            elapsed = time.perf_counter() - start
+            print(f"{name:14s} {elapsed * 1000:8.1f} ms  {elapsed / probes * 1000:7.2f} ms/probe")
+
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
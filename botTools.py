@@ -1,19 +1,39 @@
-import time
+import hashlib
+import io
+import os
 
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+import dbtools
+import timers
+
+
+def _asset_file_id(bot: telebot.TeleBot, file_path: str, media_type: str, upload) -> str:
+    """file_id of a local file, uploaded only the first time a bot sees this content."""
+    with open(file_path, "rb") as f:
+        content = f.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    bot_id = (getattr(bot, "token", None) or "").split(":")[0]
+    file_id = dbtools.get_asset_file_id(bot_id, content_hash, media_type)
+    if file_id is None:
+        upload_file = io.BytesIO(content)
+        upload_file.name = os.path.basename(file_path)  # telebot names the upload after it
+        file_id = upload(upload_file)
+        dbtools.add_asset(bot_id, content_hash, media_type, file_id)
+    return file_id
+
 
 def get_document_file_id(bot: telebot.TeleBot, file_path: str, private_channel_id: str) -> str:
     """Uploads a document file to the private channel to get a Telegram File ID."""
-    with open(file_path, "rb") as f:
-        return bot.send_document(private_channel_id, f).document.file_id
+    return _asset_file_id(bot, file_path, "document",
+                          lambda f: bot.send_document(private_channel_id, f).document.file_id)
 
 
 def get_photo_file_id(bot: telebot.TeleBot, file_path: str, private_channel_id: str) -> str:
     """Uploads a photo file to the private channel to get a Telegram File ID."""
-    with open(file_path, "rb") as f:
-        return bot.send_photo(private_channel_id, f).photo[-1].file_id
+    return _asset_file_id(bot, file_path, "photo", lambda f: bot.send_photo(private_channel_id, f).photo[-1].file_id)
 
 
 def send_status_msg(bot: telebot.TeleBot, message: telebot.types.Message,
@@ -42,15 +62,21 @@ def send_error_msg(bot: telebot.TeleBot, message: telebot.types.Message,
                           photo=sad_toro_file_id)
 
 
-def safe_delete(bot: telebot.TeleBot, message: telebot.types.Message, delay: int = 0):
-    if delay:
-        time.sleep(delay)
+def _delete(bot: telebot.TeleBot, message: telebot.types.Message):
     try:
         bot.delete_message(message.chat.id, message.message_id)
     except Exception as e:
         pass  # I'll take the gamble
 
 
+def safe_delete(bot: telebot.TeleBot, message: telebot.types.Message, delay: int = 0):
+    """Deletes the message, after delay seconds it's scheduled instead so the caller doesn't wait."""
+    if delay:
+        timers.call_later(delay, _delete, bot, message)
+    else:
+        _delete(bot, message)
+
+
 def gen_spoiler_markup(enable_spoiler: bool = True):
     markup = InlineKeyboardMarkup()
     markup.row_width = 1
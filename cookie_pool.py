@@ -0,0 +1,189 @@
+import glob
+import http.cookiejar
+import logging
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INSTAGRAM_CHECK_URL = "https://www.instagram.com/accounts/edit/"
+
+
+def load_jar(cookie_file: str) -> http.cookiejar.MozillaCookieJar:
+    jar = http.cookiejar.MozillaCookieJar()
+    jar.load(cookie_file, ignore_discard=True, ignore_expires=True)
+    return jar
+
+
+def is_instagram_jar_alive(jar: http.cookiejar.CookieJar, timeout: float = 10) -> bool:
+    """A logged in session can open the account settings, a dead one gets redirected to the login page."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.addheaders = [("User-Agent", "Mozilla/5.0")]
+
+    try:
+        resp = opener.open(INSTAGRAM_CHECK_URL, timeout=timeout)
+        return resp.geturl() == INSTAGRAM_CHECK_URL
+    except Exception as e:
+        logger.info(f"Cookie check failed: {getattr(e, 'code', 'No HTTP code')}")
+        return False
+
+
+def check_files(cookie_files: List[str], max_workers: int = 16) -> Dict[str, bool]:
+    """Checks many cookie files at the same time, returns file -> alive."""
+    def check(path):
+        try:
+            return is_instagram_jar_alive(load_jar(path))
+        except (OSError, http.cookiejar.LoadError) as e:
+            logger.error(f"Can't load cookie file {path}: {e}")
+            return False
+
+    if not cookie_files:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cookie_files))) as executor:
+        return dict(zip(cookie_files, executor.map(check, cookie_files)))
+
+
+class _Cookie:
+    __slots__ = ("path", "jar", "score", "last_used", "alive", "checking")
+
+    def __init__(self, path: str, jar: http.cookiejar.MozillaCookieJar):
+        self.path = path
+        self.jar = jar
+        self.score = 1.0
+        self.last_used = 0.0
+        self.alive = True
+        self.checking = False
+
+
+class CookiePool:
+    """Hands out Instagram cookies by health score, resting each one for a while after use.
+
+    Cookie files are parsed once. A cookie that fails a download is taken out of rotation right away
+    and only comes back if a liveness check says the session is still good.
+    """
+
+    def __init__(self, folder: str = "igcookies", cooldown: float = 60, check_interval: float = 30 * 60,
+                 max_workers: int = 16, checker: Callable[[http.cookiejar.CookieJar], bool] = is_instagram_jar_alive,
+                 clock: Callable[[], float] = time.monotonic):
+        self.folder = folder
+        self.cooldown = cooldown
+        self.check_interval = check_interval
+        self.checker = checker
+        self._clock = clock
+        self._cookies: Dict[str, _Cookie] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cookie-check")
+        self._stop = threading.Event()
+
+    def load(self):
+        """(Re)scans the folder, new files are parsed and removed ones are dropped."""
+        paths = sorted(glob.glob(os.path.join(self.folder, "*.txt")))
+        parsed = {}
+        for path in paths:
+            if path in self._cookies:
+                continue
+            try:
+                parsed[path] = _Cookie(path, load_jar(path))
+            except (OSError, http.cookiejar.LoadError) as e:
+                logger.error(f"Can't load cookie file {path}: {e}")
+
+        with self._lock:
+            for path in list(self._cookies):
+                if path not in paths:
+                    del self._cookies[path]
+            self._cookies.update(parsed)
+            self._loaded = True
+
+    def acquire(self) -> Optional[str]:
+        """Returns the healthiest rested cookie file, or the least recently used live one if all are resting."""
+        if not self._loaded:
+            self.load()
+
+        with self._lock:
+            now = self._clock()
+            usable = [c for c in self._cookies.values() if c.alive and not c.checking]
+            if not usable:
+                return None
+
+            rested = [c for c in usable if now - c.last_used >= self.cooldown]
+            if rested:
+                cookie = max(rested, key=lambda c: (c.score, -c.last_used))
+            else:
+                cookie = min(usable, key=lambda c: c.last_used)
+
+            cookie.last_used = now
+            logger.info(f"using cookie {cookie.path} (score {cookie.score:.2f})")
+            return cookie.path
+
+    def cookies_of(self, path: str) -> Dict[str, str]:
+        """The parsed cookies of a file as name -> value, so nobody has to read the file again."""
+        with self._lock:
+            cookie = self._cookies.get(path)
+            return {c.name: c.value for c in cookie.jar} if cookie else {}
+
+    def report(self, path: str, ok: bool):
+        """Feeds a download result back into the cookie's score."""
+        with self._lock:
+            cookie = self._cookies.get(path)
+            if cookie is None:
+                return
+
+            if ok:
+                cookie.score = cookie.score * 0.8 + 0.2
+                return
+
+            cookie.score *= 0.5
+            cookie.checking = True  # Out of rotation until the check below clears it
+
+        self._executor.submit(self._check, cookie)
+
+    def _check(self, cookie: _Cookie) -> bool:
+        try:
+            alive = self.checker(cookie.jar)
+        except Exception as e:
+            logger.error(f"Cookie check for {cookie.path} crashed: {e}")
+            alive = False
+
+        with self._lock:
+            cookie.alive = alive
+            cookie.checking = False
+            if not alive:
+                logger.warning(f"Cookie {cookie.path} is dead, removed from rotation")
+        return alive
+
+    def check_all(self) -> Dict[str, bool]:
+        """Checks every cookie in parallel, returns file -> alive."""
+        self.load()
+        with self._lock:
+            cookies = list(self._cookies.values())
+
+        results = self._executor.map(self._check, cookies)
+        return {cookie.path: alive for cookie, alive in zip(cookies, results)}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            alive = sum(1 for c in self._cookies.values() if c.alive and not c.checking)
+            return {"total": len(self._cookies), "alive": alive}
+
+    def start_background_checks(self):
+        """Re-checks every cookie every check_interval seconds on a daemon thread."""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    results = self.check_all()
+                    logger.info(f"Cookie check: {sum(results.values())}/{len(results)} alive")
+                except Exception as e:
+                    logger.error(f"Cookie check failed: {e}")
+                self._stop.wait(self.check_interval)
+
+        threading.Thread(target=loop, name="cookie-checks", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
@@ -1,10 +1,137 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from lrucache import LRUCache
+
+DB_PATH = 'video_ids.db'
+
+POST_CACHE_SIZE = 4096
+POST_CACHE_TTL = 6 * 60 * 60  # Seconds
+
+
+class CachedMedia(NamedTuple):
+    file_id: str
+    media_type: str
+
+
+class CachedPost(NamedTuple):
+    """Everything the cache knows about a post, media items are in album order."""
+    platform: str
+    platform_id: str
+    media: Tuple[CachedMedia, ...]
+    description: Optional[str]
+    audio_file_id: Optional[str]
+
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Bumped by close_connections, a thread holding an older connection opens a new one
+
+# In-memory copy of the hottest posts, (platform, platform_id) -> CachedPost
+_post_cache = LRUCache(POST_CACHE_SIZE, POST_CACHE_TTL)
+# Held across an insert and the cache refresh that follows it, so an older snapshot can't overwrite a newer one
+_write_lock = threading.Lock()
+# Cache misses being loaded, key -> [readers, version]. A refresh bumps the version, and a reader only caches what
+# it loaded if the version didn't change meanwhile. Entries go away with their last reader
+_loads: Dict[Tuple[str, str], List[int]] = {}
+_loads_lock = threading.Lock()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # isolation_level=None: transactions are opened explicitly by transaction()
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False,
+                                 cached_statements=256)
+    connection.execute("PRAGMA journal_mode=WAL;")
+    connection.execute("PRAGMA synchronous=NORMAL;")
+    connection.execute("PRAGMA busy_timeout=30000;")
+    return connection
+
+
+def get_connection() -> sqlite3.Connection:
+    """Returns the long-lived connection of the calling thread, opening it on first use."""
+    connection = getattr(_local, "connection", None)
+    if connection is None or getattr(_local, "generation", None) != _generation:
+        with _connections_lock:
+            connection = _connect(DB_PATH)
+            _local.connection = connection
+            _local.generation = _generation
+            _connections.append(connection)
+    return connection
+
+
+def close_connections():
+    """Closes every connection opened so far, threads will reconnect on their next query."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for connection in _connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+
+
+def set_db_path(path: str):
+    """Points the module to another database file (used by tests and benchmarks)."""
+    global DB_PATH
+    DB_PATH = path
+    close_connections()
+    _post_cache.clear()
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit and miss counters of the in-memory post cache."""
+    return _post_cache.stats()
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """Runs the block in a transaction on this thread's connection, rolling back on errors."""
+    connection = get_connection()
+    if connection.in_transaction:  # Nested, the outer block owns commit/rollback
+        yield connection
+        return
+
+    connection.execute("BEGIN IMMEDIATE;" if immediate else "BEGIN;")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK;")
+        raise
+    else:
+        connection.execute("COMMIT;")
 
 
-def prepare_db():
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
+def _fetchone(query: str, params: tuple):
+    return get_connection().execute(query, params).fetchone()
+
+
+def _fetchall(query: str, params: tuple):
+    return get_connection().execute(query, params).fetchall()
+
+
+def _insert_row(connection: sqlite3.Connection, file_id: str, platform_id: str, platform: str, media_type: str):
+    # Items get the next position of their post, so albums come back in the order they were added
+    connection.execute("""
+                       INSERT INTO videos (file_id, platform_id, platform, media_type, position)
+                       SELECT ?, ?, ?, ?, COALESCE(MAX(position) + 1, 0)
+                       FROM videos
+                       WHERE platform = ? AND platform_id = ?;""",
+                       (file_id, platform_id, platform, media_type, platform, platform_id))
+
+
+def _insert_media(file_id: str, platform_id: str, platform: str, media_type: str):
+    with _write_lock:
+        with transaction(immediate=True) as connection:
+            _insert_row(connection, file_id, platform_id, platform, media_type)
+        _refresh_cached_post(platform_id, platform)
+
 
+def _migration_1_initial_schema(cursor: sqlite3.Cursor):
     cursor.execute("""
                    CREATE TABLE IF NOT EXISTS videos
                    (
@@ -47,132 +174,196 @@ def prepare_db():
                        );""")
 
 
-def get_number_of_media_by_platform_id(platform_id: str) -> int:
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT COUNT(*)
-                   FROM videos
-                   WHERE platform_id = "{platform_id}";""")
+def _migration_2_platform_keys_and_order(cursor: sqlite3.Cursor):
+    """Keys rows on (platform, platform_id), adds the item order and the lookup index."""
+    cursor.execute("""
+                   CREATE TABLE videos_new
+                   (
+                       file_id     VARCHAR(255),
+                       platform_id VARCHAR(255),
+                       platform    VARCHAR(255),
+                       media_type  VARCHAR(255),
+                       position    INTEGER NOT NULL DEFAULT 0,
+                       PRIMARY KEY (file_id, platform_id, platform)
+                   );""")
+
+    # Existing rows were inserted in album order, rowid keeps that order
+    cursor.execute("""
+                   INSERT INTO videos_new (file_id, platform_id, platform, media_type, position)
+                   SELECT file_id,
+                          platform_id,
+                          platform,
+                          media_type,
+                          ROW_NUMBER() OVER (PARTITION BY platform, platform_id ORDER BY rowid) - 1
+                   FROM videos;""")
+
+    cursor.execute("DROP TABLE videos;")
+    cursor.execute("ALTER TABLE videos_new RENAME TO videos;")
+
+    # Covering index: every cache lookup is answered from the index alone
+    cursor.execute("""
+                   CREATE INDEX idx_videos_lookup
+                       ON videos (platform, platform_id, position, media_type, file_id);""")
 
-    return cursor.fetchone()[0]
+    cursor.execute("""
+                   CREATE TABLE descriptions_new
+                   (
+                       description TEXT,
+                       platform_id VARCHAR(255),
+                       platform    VARCHAR(255),
+                       PRIMARY KEY (platform, platform_id)
+                   );""")
 
+    cursor.execute("""
+                   INSERT OR IGNORE INTO descriptions_new (description, platform_id, platform)
+                   SELECT description, platform_id, platform
+                   FROM descriptions;""")
 
-def get_number_of_descriptions_by_platform_id(platform_id: str) -> int:
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT COUNT(*)
-                   FROM descriptions
-                   WHERE platform_id = "{platform_id}";""")
+    cursor.execute("DROP TABLE descriptions;")
+    cursor.execute("ALTER TABLE descriptions_new RENAME TO descriptions;")
 
-    return cursor.fetchone()[0]
 
+def _migration_3_assets(cursor: sqlite3.Cursor):
+    # file_ids of the bot's own images, so they're uploaded once and not on every start
+    cursor.execute("""
+                   CREATE TABLE assets
+                   (
+                       bot_id       VARCHAR(255),
+                       content_hash VARCHAR(64),
+                       media_type   VARCHAR(255),
+                       file_id      VARCHAR(255),
+                       PRIMARY KEY (bot_id, content_hash, media_type)
+                   );""")
 
-def add_video(file_id: str, platform_id: str, platform: str):
-    connection = sqlite3.connect('video_ids.db')
-    try:
-        cursor = connection.cursor()
-        cursor.execute(f"""
-                           INSERT INTO videos VALUES ("{file_id}", "{platform_id}", "{platform}", "video");""")
 
-        connection.commit()
-    except Exception as e:
-        connection.close()
-        raise e
+# Append only: the position of a migration in this list is the schema version it produces
+MIGRATIONS = [
+    _migration_1_initial_schema,
+    _migration_2_platform_keys_and_order,
+    _migration_3_assets,
+]
 
 
-def add_photo(file_id: str, platform_id: str, platform: str):
-    connection = sqlite3.connect('video_ids.db')
-    try:
-        cursor = connection.cursor()
-        cursor.execute(f"""
-                       INSERT INTO videos VALUES ("{file_id}", "{platform_id}", "{platform}", "photo");""")
+def get_schema_version() -> int:
+    return get_connection().execute("PRAGMA user_version;").fetchone()[0]
 
-        connection.commit()
-    except Exception as e:
-        connection.close()
-        raise e
 
+def prepare_db():
+    """Creates the DB if not present and brings its schema up to date."""
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        with transaction(immediate=True) as connection:
+            # Checked inside the write lock, in case another process migrated in the meantime
+            if connection.execute("PRAGMA user_version;").fetchone()[0] >= version:
+                continue
 
-def add_gif(file_id: str, platform_id: str, platform: str):
-    connection = sqlite3.connect('video_ids.db')
-    try:
-        cursor = connection.cursor()
-        cursor.execute(f"""
-                       INSERT INTO videos VALUES ("{file_id}", "{platform_id}", "{platform}", "gif");""")
+            migration(connection.cursor())
+            connection.execute(f"PRAGMA user_version = {version};")
 
-        connection.commit()
-    except Exception as e:
-        connection.close()
-        raise e
 
+def add_video(file_id: str, platform_id: str, platform: str):
+    _insert_media(file_id, platform_id, platform, "video")
+
+
+def add_photo(file_id: str, platform_id: str, platform: str):
+    _insert_media(file_id, platform_id, platform, "photo")
 
-def add_sound(file_id: str, platform_id: str, platform: str):
-    connection = sqlite3.connect('video_ids.db')
-    try:
-        cursor = connection.cursor()
-        cursor.execute(f"""
-                           INSERT INTO videos VALUES ("{file_id}", "{platform_id}", "{platform}", "sound");""")
 
-        connection.commit()
-    except Exception as e:
-        connection.close()
-        raise e
+def add_gif(file_id: str, platform_id: str, platform: str):
+    _insert_media(file_id, platform_id, platform, "gif")
+
+
+def add_sound(file_id: str, platform_id: str, platform: str):
+    _insert_media(file_id, platform_id, platform, "sound")
 
 
 def add_description(description: str, platform_id: str, platform: str):
-    connection = sqlite3.connect('video_ids.db')
+    with _write_lock:
+        with transaction(immediate=True) as connection:
+            connection.execute("INSERT INTO descriptions VALUES (?, ?, ?);", (description, platform_id, platform))
+        _refresh_cached_post(platform_id, platform)
+
+
+def add_album(items: List[Tuple[str, str]], platform_id: str, platform: str, description: Optional[str] = None):
+    """Stores the (file_id, media_type) items of a post in order, and its description, in one transaction.
+
+    The post is cached once everything is committed, so nobody is served part of an album.
+    """
+    with _write_lock:
+        with transaction(immediate=True) as connection:
+            for file_id, media_type in items:
+                _insert_row(connection, file_id, platform_id, platform, media_type)
+            if description is not None:
+                connection.execute("INSERT INTO descriptions VALUES (?, ?, ?);", (description, platform_id, platform))
+        _refresh_cached_post(platform_id, platform)
+
+
+def get_asset_file_id(bot_id: str, content_hash: str, media_type: str) -> Optional[str]:
+    """file_id of an uploaded asset, file_ids only work for the bot that uploaded them."""
+    row = _fetchone("SELECT file_id FROM assets WHERE bot_id = ? AND content_hash = ? AND media_type = ?;",
+                    (bot_id, content_hash, media_type))
+    return row[0] if row else None
+
+
+def add_asset(bot_id: str, content_hash: str, media_type: str, file_id: str):
+    with _write_lock:
+        with transaction(immediate=True) as connection:
+            connection.execute("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?);",
+                               (bot_id, content_hash, media_type, file_id))
+
+
+def get_cached_post(platform_id: str, platform: str) -> Optional[CachedPost]:
+    """Returns what the cache knows about a post, None if it's not cached."""
+    key = (platform, platform_id)
+    post = _post_cache.get(key)
+    if post is not None:
+        return post
+
+    with _loads_lock:
+        load = _loads.setdefault(key, [0, 0])
+        load[0] += 1
+        version = load[1]
     try:
-        cursor = connection.cursor()
-        query = ("""
-                           INSERT INTO descriptions VALUES (?, ?, ?);""")
-        cursor.execute(query, (description, platform_id, platform))
-
-        connection.commit()
-    except Exception as e:
-        connection.close()
-        raise e
-
-
-def get_first_media(platform_id: str):
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT *
-                   FROM videos AS v
-                   WHERE v.platform_id = "{platform_id}";""")
-
-    return cursor.fetchone()
-
-
-def get_first_sound(platform_id: str):
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT *
-                   FROM videos AS v
-                   WHERE v.platform_id = "{platform_id}" AND v.media_type="sound";""")
-
-    return cursor.fetchone()
-
-def get_first_description(platform_id: str):
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT *
-                   FROM descriptions AS d
-                   WHERE d.platform_id = "{platform_id}";""")
-
-    return cursor.fetchone()
-
-
-def get_all_media(platform_id: str):
-    connection = sqlite3.connect('video_ids.db')
-    cursor = connection.cursor()
-    cursor.execute(f"""
-                   SELECT *
-                   FROM videos AS v
-                   WHERE v.platform_id = "{platform_id}";""")
-
-    return cursor.fetchall()
+        post = _load_post(platform_id, platform)
+    finally:
+        with _loads_lock:
+            # A write refreshed the entry after our read, it's newer than what we have
+            if post is not None and load[1] == version:
+                _post_cache.put(key, post)
+            load[0] -= 1
+            if not load[0]:
+                del _loads[key]
+
+    return post
+
+
+def _refresh_cached_post(platform_id: str, platform: str):
+    # Replaces whatever was cached for the post with what was just committed
+    with _loads_lock:
+        load = _loads.get((platform, platform_id))
+        if load is not None:
+            load[1] += 1
+    _post_cache.invalidate((platform, platform_id))
+    post = _load_post(platform_id, platform)
+    if post is not None:
+        _post_cache.put((platform, platform_id), post)
+
+
+def _load_post(platform_id: str, platform: str) -> Optional[CachedPost]:
+    """Fetches media, description and audio of a post in one indexed query."""
+    rows = _fetchall("""
+                     SELECT v.file_id,
+                            v.media_type,
+                            (SELECT d.description
+                             FROM descriptions AS d
+                             WHERE d.platform = v.platform AND d.platform_id = v.platform_id)
+                     FROM videos AS v
+                     WHERE v.platform = ? AND v.platform_id = ?
+                     ORDER BY v.position;""", (platform, platform_id))
+
+    if not rows:
+        return None
+
+    media = tuple(CachedMedia(file_id, media_type) for file_id, media_type, _ in rows if media_type != "sound")
+    audio_file_id = next((file_id for file_id, media_type, _ in rows if media_type == "sound"), None)
+
+    return CachedPost(platform, platform_id, media, rows[0][2], audio_file_id)
@@ -1,3 +1,13 @@
 class FileTooBigException(Exception):
     """Exception raised when downloaded file is too big"""
     pass
+
+
+class ScratchFullException(Exception):
+    """Exception raised when a job can't get scratch space in time"""
+    pass
+
+
+class ScratchQuotaException(Exception):
+    """Exception raised when a job's files together outgrow the scratch space it reserved"""
+    pass
@@ -0,0 +1,203 @@
+import copy
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from gallery_dl import config, exception, extractor, job
+from gallery_dl.extractor import common
+
+import exceptions
+
+logger = logging.getLogger(__name__)
+
+# gallery-dl has no per-job config, so this module binds private parts of it (version pinned in requirements.txt)
+_REQUIRED_INTERNALS = [
+    (config, "_config"),
+    (config, "interpolate_common"),
+    (config, "accumulate"),
+    (common.Extractor, "_config_shared"),
+    (common.Extractor, "_config_shared_accumulate"),
+    (common.Extractor, "config_accumulate"),
+    (job.DownloadJob, "get_downloader"),
+]
+
+
+def _check_internals():
+    missing = [f"{owner.__name__}.{name}" for owner, name in _REQUIRED_INTERNALS if not hasattr(owner, name)]
+    if missing:
+        raise ImportError(f"Unsupported gallery-dl version, missing {', '.join(missing)}")
+
+
+_check_internals()
+
+_base_config: Optional[dict] = None
+_base_lock = threading.Lock()
+
+
+def base_config() -> dict:
+    """Parses the gallery-dl config files once, every job starts from a copy of the result."""
+    global _base_config
+    with _base_lock:
+        if _base_config is None:
+            config.load()  # config file is in /etc/gallery-dl.conf or %APPDATA%\gallery-dl\config.json
+            _base_config = copy.deepcopy(config._config)
+        return _base_config
+
+
+def job_config(overrides: Dict[Tuple[str, ...], Dict[str, Any]]) -> dict:
+    """Builds the private config of one job: the base config plus the overrides, keyed by config path."""
+    conf = copy.deepcopy(base_config())
+    for path, values in overrides.items():
+        for key, value in values.items():
+            config.set(path, key, value, conf=conf)
+    return conf
+
+
+def _resolve_postprocessors(values: list, conf: dict) -> list:
+    # Named postprocessors are looked up by gallery-dl in the global config, resolve them in the job's one instead
+    named = conf.get("postprocessor") or {}
+    return [named.get(pp, pp) if isinstance(pp, str) else pp for pp in values]
+
+
+def _bind_config(extr, conf: dict):
+    """Makes the extractor read its options from conf instead of gallery-dl's process-wide config."""
+    if not hasattr(extr, "_cfgpath"):
+        raise RuntimeError(f"Unsupported gallery-dl version, {type(extr).__name__} has no _cfgpath")
+
+    def cfg(key, default=None):
+        return config.interpolate(extr._cfgpath, key, default, conf=conf)
+
+    def cfg_shared(key, default=None):
+        return config.interpolate_common(("extractor",), extr._cfgpath, key, default, conf=conf)
+
+    def cfg_accumulate(key):
+        values = config.accumulate(extr._cfgpath, key, conf=conf)
+        return _resolve_postprocessors(values, conf) if key == "postprocessors" else values
+
+    def cfg_shared_accumulate(key):
+        # Same walk as Extractor._config_shared_accumulate, used by child jobs
+        values = []
+        for index, path in enumerate(extr._cfgpath):
+            if index == 0:
+                values = config.accumulate(("extractor",) + path, key, conf=conf)
+            elif sub := config.get(("extractor",), path[0], conf=conf):
+                values[:0] = config.accumulate((extr.subcategory,), key, conf=sub)
+        return _resolve_postprocessors(values, conf) if key == "postprocessors" else values
+
+    # Job.__init__ swaps config for _config_shared on child jobs, so both have to be bound
+    extr.config = cfg
+    extr._config_shared = cfg_shared
+    extr.config_accumulate = cfg_accumulate
+    extr._config_shared_accumulate = cfg_shared_accumulate
+
+
+class IsolatedDownloadJob(job.DownloadJob):
+    """A DownloadJob with its own config, so several of them can run at the same time."""
+
+    def __init__(self, url, parent=None, conf: Optional[dict] = None, max_filesize: Optional[int] = None,
+                 max_total: Optional[int] = None):
+        if conf is None:
+            conf = parent.conf  # Child jobs (e.g. quoted posts) share their parent's config
+        self.conf = conf
+        self.root = parent.root if parent is not None else self
+        self.max_filesize = max_filesize if parent is None else parent.max_filesize
+        self.max_total = max_total if parent is None else parent.max_total
+        self.written = 0  # Bytes downloaded by the job and its children, counted on the root
+        self.oversized = False  # A single file was over max_filesize
+        self.over_quota = False  # The files together were over max_total
+
+        extr = extractor.find(url) if isinstance(url, str) else url
+        if extr is not None:
+            _bind_config(extr, conf)
+
+        job.DownloadJob.__init__(self, extr, parent)
+
+    def _size_limit(self) -> Optional[int]:
+        # The next file may use whatever is left of max_total, and never more than max_filesize
+        limits = [self.max_filesize] if self.max_filesize else []
+        if self.max_total:
+            limits.append(max(1, self.max_total - self.root.written))
+        return min(limits) if limits else None
+
+    def get_downloader(self, scheme):
+        # Downloaders read filesize-max from the global config, so the job's limit is set on the instance
+        instance = job.DownloadJob.get_downloader(self, scheme)
+        limit = self._size_limit()
+        if instance is not None and limit and hasattr(instance, "maxsize"):
+            instance.maxsize = limit
+        return instance
+
+    def download(self, url):
+        ok = job.DownloadJob.download(self, url)
+        limit = self._size_limit()
+        if ok and limit and self._skipped_as_oversized():
+            # Skipped under a limit lowered by max_total, the file alone may have fit
+            self._stop(over_quota=limit != self.max_filesize)
+
+        if ok and self.max_total:
+            # Files without a Content-Length aren't checked up front, the total is checked after each of them
+            self.root.written += self._downloaded_size()
+            if self.root.written > self.max_total:
+                self._stop(over_quota=True)
+        return ok
+
+    def _stop(self, over_quota: bool):
+        if over_quota:
+            self.root.over_quota = True
+        else:
+            self.root.oversized = True
+        raise exception.StopExtraction()
+
+    def _downloaded_size(self) -> int:
+        for path in (self.pathfmt.temppath, self.pathfmt.realpath):
+            if path and os.path.exists(path):
+                return os.path.getsize(path)
+        return 0
+
+    def _skipped_as_oversized(self) -> bool:
+        # The HTTP downloader "succeeds" without a temp file when Content-Length is over filesize-max. A file that
+        # was already on disk also leaves no temp file, but its real path exists.
+        return not self.pathfmt.temppath and not os.path.exists(self.pathfmt.realpath)
+
+
+class IsolatedDataJob(job.DataJob):
+    """A DataJob with its own config, collects file URLs and metadata without downloading anything."""
+
+    def __init__(self, url, parent=None, conf: Optional[dict] = None):
+        if conf is None:
+            conf = parent.conf
+        self.conf = conf
+
+        extr = extractor.find(url) if isinstance(url, str) else url
+        if extr is not None:
+            _bind_config(extr, conf)
+
+        job.DataJob.__init__(self, extr, parent, file=None)
+
+
+def extract_urls(url: str, overrides: Dict[Tuple[str, ...], Dict[str, Any]]) -> List[Tuple[str, dict]]:
+    """Resolves the file URLs of a post with their metadata, without downloading them."""
+    data_job = IsolatedDataJob(url, conf=job_config(overrides))
+    data_job.run()
+    if data_job.exception is not None:
+        raise data_job.exception
+    return list(zip(data_job.data_urls, data_job.data_meta))
+
+
+def run_download(url: str, overrides: Dict[Tuple[str, ...], Dict[str, Any]], max_filesize: Optional[int] = None,
+                 max_total: Optional[int] = None) -> int:
+    """Runs a gallery-dl download with its own copy of the config, returns gallery-dl's status code.
+
+    Raises FileTooBigException as soon as a file turns out to be bigger than max_filesize, and ScratchQuotaException
+    when the files together are bigger than max_total. Files whose size is announced are stopped before they're
+    downloaded.
+    """
+    download_job = IsolatedDownloadJob(url, conf=job_config(overrides), max_filesize=max_filesize,
+                                       max_total=max_total)
+    status = download_job.run()
+    if download_job.oversized:
+        raise exceptions.FileTooBigException()
+    if download_job.over_quota:
+        raise exceptions.ScratchQuotaException()
+    return status
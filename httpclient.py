@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import exceptions
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_TIMEOUT = (5, 30)  # Connect, read (between two chunks)
+
+
+def make_session(pool_maxsize: int = 32) -> requests.Session:
+    """A keep-alive session whose connection pool is big enough for every worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+SESSION = make_session()
+
+
+class ByteBudget:
+    """Bytes several downloads may write together, shared between the threads writing them."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def charge(self, n: int):
+        """Raises ScratchQuotaException once the downloads go past the limit."""
+        with self._lock:
+            self.used += n
+            if self.used > self.limit:
+                raise exceptions.ScratchQuotaException()
+
+    def refund(self, n: int):
+        with self._lock:
+            self.used -= n
+
+
+def total_size(response: requests.Response) -> Optional[int]:
+    """The full size of the resource as announced by the server, None if it didn't say."""
+    if response.status_code == 206:
+        # Content-Length is only the size of the part, the total comes after the slash of "bytes 0-99/1234"
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    else:
+        total = response.headers.get("Content-Length", "")
+    return int(total) if total.isdigit() else None
+
+
+def remote_size(url: str, session: requests.Session = SESSION, timeout=DEFAULT_TIMEOUT) -> Optional[int]:
+    """Size announced by a HEAD request, None if the server doesn't say or doesn't answer."""
+    try:
+        with session.head(url, allow_redirects=True, timeout=timeout) as response:
+            if response.ok:
+                return total_size(response)
+    except requests.RequestException as e:
+        logger.info(f"HEAD {url} failed: {e}")
+    return None
+
+
+def stream_to_file(url: str, path: str, max_bytes: Optional[int] = None, session: requests.Session = SESSION,
+                   timeout=DEFAULT_TIMEOUT, ranged: bool = False, headers: Optional[dict] = None,
+                   budget: Optional[ByteBudget] = None, **kwargs) -> int:
+    """Downloads url to path in chunks, aborting as soon as it gets bigger than max_bytes.
+
+    With ranged, only the first max_bytes + 1 bytes are asked for: servers that support ranges announce
+    the full size up front and can never send more than one byte past the limit.
+    Every chunk is also charged to budget when there's one, shared with the other files of the same job.
+    Raises FileTooBigException when a limit is passed, the partial file is removed on any error.
+    Returns the number of bytes written.
+    """
+    headers = dict(headers or {})
+    if ranged and max_bytes is not None:
+        headers["Range"] = f"bytes=0-{max_bytes}"
+
+    written = 0
+    with session.get(url, stream=True, timeout=timeout, headers=headers, **kwargs) as response:
+        response.raise_for_status()
+
+        size = total_size(response)
+        if max_bytes is not None and size is not None and size > max_bytes:
+            logger.info(f"{url} is {size} bytes, over the {max_bytes} bytes limit")
+            raise exceptions.FileTooBigException()
+
+        try:
+            with open(path, "wb") as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    written += len(chunk)
+                    if budget is not None:
+                        budget.charge(len(chunk))
+                    if max_bytes is not None and written > max_bytes:
+                        raise exceptions.FileTooBigException()
+                    file.write(chunk)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            if budget is not None:
+                budget.refund(written)  # The file is gone, so are its bytes
+            raise
+
+    return written
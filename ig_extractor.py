@@ -2,11 +2,38 @@ import html
 import json
 import os
 import re
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Optional
 
+import httpclient
 
-def download_media_embed(shortcode: str) -> str:
-    """Downloads media from Instagram using embeds"""
+MAX_FILE_SIZE = 50 * 1024 * 1024
+MAX_PARALLEL_ITEMS = 4  # Carousel items downloaded at the same time
+
+
+def _download_items(items: list, max_bytes: int, max_total: Optional[int] = None):
+    """Streams (url, path) pairs to disk, MAX_PARALLEL_ITEMS at a time. Stops at the first failure.
+
+    max_bytes is the limit of each file, max_total the one of all of them together.
+    """
+    budget = httpclient.ByteBudget(max_total) if max_total else None
+    if len(items) == 1:
+        httpclient.stream_to_file(items[0][0], items[0][1], max_bytes, budget=budget)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_ITEMS, len(items))) as executor:
+        futures = [executor.submit(httpclient.stream_to_file, url, path, max_bytes, budget=budget)
+                   for url, path in items]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in done:
+            future.result()  # Re-raises the first error, e.g. FileTooBigException or ScratchQuotaException
+
+
+def download_media_embed(shortcode: str, folder: str, max_bytes: int = MAX_FILE_SIZE,
+                         max_total: Optional[int] = None) -> str:
+    """Downloads media from Instagram using embeds, into folder, at most max_total bytes in all"""
     cookies = {
         'wd': '1920x697',
     }
@@ -25,10 +52,10 @@ def download_media_embed(shortcode: str) -> str:
         'Priority': 'u=0, i',
     }
 
-    r = requests.get(f'https://www.instagram.com/p/{shortcode}/embed/captioned', headers=headers, cookies=cookies)
+    r = httpclient.SESSION.get(f'https://www.instagram.com/p/{shortcode}/embed/captioned', headers=headers,
+                               cookies=cookies, timeout=httpclient.DEFAULT_TIMEOUT)
 
-    if not os.path.exists(f'media-downloads/instagram/{shortcode}'):
-        os.makedirs(f"media-downloads/instagram/{shortcode}")
+    os.makedirs(folder, exist_ok=True)
 
     if 'class="WatchOnInstagram">Watch on Instagram' in r.text:
         raise ValueError('Exception: Video is not embeddable')
@@ -40,27 +67,21 @@ def download_media_embed(shortcode: str) -> str:
         m = re.search(r'"contextJSON"\s*:\s*("(?:\\.|[^"\\])*")', r.text)
         ctx = json.loads(json.loads(m.group(1)))  # string → object
         media = ctx["gql_data"]
+        items = []
         for i, item in enumerate(media['shortcode_media']['edge_sidecar_to_children']['edges']):
             if item['node']['is_video']:
                 url = item['node']['video_url']
-                video = requests.get(html.unescape(url))
-                with open(f'media-downloads/instagram/{shortcode}/{shortcode}{i}.mp4', 'wb') as file:
-                    file.write(video.content)
+                items.append((html.unescape(url), f'{folder}/{shortcode}{i}.mp4'))
             else:
                 url = item['node']['display_url']
-                img = requests.get(html.unescape(url))
-                with open(f'media-downloads/instagram/{shortcode}/{shortcode}{i}.webp', 'wb') as file:
-                    file.write(img.content)
+                items.append((html.unescape(url), f'{folder}/{shortcode}{i}.webp'))
+        _download_items(items, max_bytes, max_total)
     elif 'video_url' in r.text:
         url = r.text.split('video_url\\":\\"')[1].split('\\"')[0]
-        video = requests.get(url.replace('\\', ''))
-        with open(f'media-downloads/instagram/{shortcode}/{shortcode}0.mp4', 'wb') as file:
-            file.write(video.content)
+        _download_items([(url.replace('\\', ''), f'{folder}/{shortcode}0.mp4')], max_bytes, max_total)
     elif 'img class="EmbeddedMediaImage' in r.text:
         url = r.text.split('img class="EmbeddedMediaImage"')[1].split('src="')[1].split('"')[0]
-        img = requests.get(html.unescape(url))
-        with open(f'media-downloads/instagram/{shortcode}/{shortcode}0.webp', 'wb') as file:
-            file.write(img.content)
+        _download_items([(html.unescape(url), f'{folder}/{shortcode}0.webp')], max_bytes, max_total)
 
     if '</a><br /><br />' in r.text:
         if 'CaptionCommentsExpand' in r.text:
@@ -5,13 +5,11 @@ import json
 import logging
 import os
 import platform
-import random
-import shutil
-import string
 import telebot
-import urllib
-import urllib.request
-import yt_dlp
+from contextlib import nullcontext
+from importlib import metadata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from dotenv import load_dotenv
 from strip_markdown import strip_markdown
 from telebot.types import InputMediaPhoto, InputMediaVideo, Message, InputMediaDocument, ReactionTypeEmoji, \
@@ -21,8 +19,18 @@ import botTools
 import commands
 import dbtools
 import exceptions
+import httpclient
 import ig_extractor
+import metrics
+import ratelimit
+import reactions
+import scheduler
+import scratch
+import sender
+import singleflight
 import toolbox as util
+import webhook
+import ytdl_engine
 
 # --- Setup ---
 
@@ -39,11 +47,26 @@ util.cleanup()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 PRIVATE_CHANNEL_ID = os.getenv("PRIVATE_CHANNEL_ID")
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")
-TEMP_DIR = Path("media-downloads")
 IMG_DIR = Path("img")
 
 bot = telebot.TeleBot(BOT_TOKEN)
 
+# A message with several links gets one reaction for all of them
+message_reactions = reactions.MessageReactions(
+    lambda chat_id, message_id, emoji: bot.set_message_reaction(chat_id, message_id, [ReactionTypeEmoji(emoji)]))
+
+# Every Bot API call goes through here, storage channel uploads may burst harder than a normal group
+rate_limiter = ratelimit.RateLimiter(ADMIN_USER_ID, chat_rates={PRIVATE_CHANNEL_ID: (1, 20)})
+ratelimit.install(rate_limiter)
+
+# "polling" or "webhook", the webhook needs WEBHOOK_URL (public base URL) unless it's registered by hand
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
 dbtools.prepare_db()  # Creates the DB if not present
 
 BIGRAT_FILE_ID = botTools.get_photo_file_id(bot, "img/bigrat.jpg", PRIVATE_CHANNEL_ID)
@@ -52,6 +75,82 @@ CUBE_TORO_FILE_ID = botTools.get_photo_file_id(bot, "img/cube.png", PRIVATE_CHAN
 
 MAX_DESCRIPTION_LENGTH = 900
 
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+PLATFORM_LIMITS = scheduler.parse_platform_limits(os.getenv("PLATFORM_LIMITS", "instagram=2,youtube=2"))
+
+download_scheduler = scheduler.DownloadScheduler(DOWNLOAD_WORKERS, PLATFORM_LIMITS)
+download_scheduler.start()
+
+# Replies that need no download are queued per chat: handler threads never wait on the rate limiter, and a chat
+# that is out of tokens only holds up its own replies
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+
+reply_scheduler = scheduler.DownloadScheduler(REPLY_WORKERS, default_limit=1)
+reply_scheduler.start()
+
+
+def react(message: Message, emoji: str):
+    message_reactions.react(message.chat.id, message.id, emoji)
+
+
+def reply_later(chat_id, fn, *args, **kwargs):
+    """Runs fn on a reply worker, after everything queued before it for the same chat."""
+    return reply_scheduler.submit(str(chat_id), fn, *args, **kwargs)
+
+
+# Coalesces concurrent requests for the same post, keyed on (platform, platform id)
+inflight_downloads = singleflight.SingleFlight()
+
+# Album items are uploaded to the private channel in parallel, shared by all jobs so the total stays capped
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+# Sites whose single image posts Telegram can fetch by itself
+URL_UPLOAD_PLATFORMS = ["danbooru", "safebooru"]
+
+# Every job downloads into its own folder under SCRATCH_DIR, running jobs can't reserve more than SCRATCH_QUOTA_MB
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "scratch")
+SCRATCH_QUOTA = int(os.getenv("SCRATCH_QUOTA_MB", "1024")) * 1024 * 1024
+# A tmpfs (e.g. /dev/shm/torodl) for the photo only sites below, RAM isn't used when it's not set
+SCRATCH_RAM_DIR = os.getenv("SCRATCH_RAM_DIR")
+SCRATCH_RAM_QUOTA = int(os.getenv("SCRATCH_RAM_QUOTA_MB", "256")) * 1024 * 1024
+RAM_SCRATCH_PLATFORMS = ["danbooru", "safebooru"]
+
+# yt-dlp keeps the video and audio streams until they're merged, so a video can take twice the size limit
+VIDEO_SCRATCH_BYTES = 2 * util.MAX_FILE_SIZE
+# Albums have a file size limit per item, this caps the whole post. The default is a full media group of the
+# biggest files, a post over it is reported to the admin as a quota problem. The photo only sites have single images
+GALLERY_SCRATCH_BYTES = int(os.getenv("GALLERY_SCRATCH_MB", "0")) * 1024 * 1024 or 10 * util.MAX_FILE_SIZE
+THUMBNAIL_SCRATCH_BYTES = 5 * 1024 * 1024
+
+scratch_space = scratch.ScratchSpace(SCRATCH_DIR, SCRATCH_QUOTA, SCRATCH_RAM_DIR, SCRATCH_RAM_QUOTA)
+scratch_space.reset()
+
+# Exposed on 127.0.0.1:METRICS_PORT/metrics in the Prometheus text format, 0 turns it off
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+metrics.Callback("torodl_post_cache_requests_total", "Post cache lookups in dbtools.",
+                 lambda: {("hit",): dbtools.cache_stats()["hits"], ("miss",): dbtools.cache_stats()["misses"]},
+                 "counter", ("result",))
+metrics.Callback("torodl_post_cache_size", "Posts in the in-memory cache.", lambda: dbtools.cache_stats()["size"])
+metrics.Callback("torodl_jobs_pending", "Downloads waiting for a worker.", download_scheduler.pending)
+metrics.Callback("torodl_jobs_running", "Downloads running right now.", download_scheduler.running)
+metrics.Callback("torodl_replies_pending", "Replies waiting for a reply worker.", reply_scheduler.pending)
+metrics.Callback("torodl_telegram_requests_total", "Bot API requests by what the rate limiter did with them.",
+                 lambda: {(k,): v for k, v in rate_limiter.stats().items()}, "counter", ("outcome",))
+metrics.Callback("torodl_scratch_reserved_bytes", "Scratch space reserved by running jobs.",
+                 lambda: {(storage,): scratch_space.stats()[key]
+                          for storage, key in [("disk", "reserved"), ("ram", "ram_reserved")]},
+                 "gauge", ("storage",))
+metrics.Callback("torodl_scratch_waiting", "Jobs waiting for scratch space.", lambda: scratch_space.stats()["waiting"])
+metrics.Callback("torodl_ig_cookies_alive", "Instagram cookies in rotation.", lambda: util.ig_cookies.stats()["alive"])
+
+# Links after this many in the same message are ignored
+MAX_LINKS_PER_MESSAGE = int(os.getenv("MAX_LINKS_PER_MESSAGE", "10"))
+
+# Keep the audio track of downloaded YouTube videos, so the audio button is served from the cache
+KEEP_VIDEO_AUDIO = os.getenv("KEEP_VIDEO_AUDIO", "true").lower() == "true"
+
 commands.register_commands(bot, CUBE_TORO_FILE_ID)
 
 
@@ -82,59 +181,65 @@ def handle_spoiler_button(call):
 
 
 def handle_audio_button(call: CallbackQuery):
+    """Cached audio goes out from the chat's reply queue, the rest is downloaded on a download worker."""
     shortcode = call.data.split("$")[1]
-    url = util.get_yt_video_url(shortcode)
+    parsed = util.parse_url(util.get_yt_video_url(shortcode))
     bot.answer_callback_query(call.id, "Getting audio...")
 
-    if send_audio_from_cache(call.message, url, shortcode):
-        bot.set_message_reaction(call.message.chat.id, call.message.id, [ReactionTypeEmoji('👌')])
-        return
+    post = dbtools.get_cached_post(parsed.post_id, parsed.platform)
+    if post and post.audio_file_id:
+        reply_later(call.message.chat.id, send_cached_audio, call.message, parsed)
+    else:
+        download_scheduler.submit(parsed.platform, download_and_send_audio, call.message, parsed)
 
-    bot.set_message_reaction(call.message.chat.id, call.message.id, [ReactionTypeEmoji('👀')])
 
-    filename = util.get_filename(url, "m4a")
-    file_path = Path("yt-dlp-downloads/" + filename)
-    thumb_path = Path("yt-dlp-downloads/" + util.get_filename(url, "webp"))
+def send_cached_audio(message: Message, parsed: util.ParsedUrl):
+    if send_audio_from_cache(message, parsed):
+        react(message, '👌')
+
+
+def download_and_send_audio(message: Message, parsed: util.ParsedUrl):
+    url = parsed.canonical_url
+    react(message, '👀')
 
     try:
-        info = util.download_audio(url, filename)
-
-        # Upload
-        if file_path.exists():
-            if util.is_file_smaller_than_50mb(str(file_path)):
-                with file_path.open('rb') as audio_file, thumb_path.open('rb') as thumb_file:
-                    resp = bot.send_audio(
-                        chat_id=call.message.chat.id,
-                        audio=audio_file,
-                        title=info.get("track") or info.get("title"),
-                        performer=info.get("artist") or info.get("uploader"),
-                        thumbnail=thumb_file,
-                        caption=f"Here's your [audio]({url}) >w<",
-                        parse_mode="Markdown",
-                        reply_to_message_id=call.message.id
-                    )
-                # Save to DB
-                dbtools.add_sound(resp.audio.file_id, util.get_platform_video_id(url), util.get_platform(url))
-                bot.set_message_reaction(call.message.chat.id, call.message.id, [ReactionTypeEmoji('👌')])
+        with scratch_space.acquire(f"audio-{parsed.post_id}", util.MAX_FILE_SIZE) as job:
+            file_path = job.path / util.get_parsed_filename(parsed, "m4a")
+            thumb_path = job.path / util.get_parsed_filename(parsed, "webp")
+
+            info = util.download_audio(url, str(file_path), util.probe_video(url))
+
+            # Upload
+            if file_path.exists():
+                if util.is_file_smaller_than_50mb(str(file_path)):
+                    with file_path.open('rb') as audio_file, thumb_path.open('rb') as thumb_file:
+                        resp = bot.send_audio(
+                            chat_id=message.chat.id,
+                            audio=audio_file,
+                            title=info.get("track") or info.get("title"),
+                            performer=info.get("artist") or info.get("uploader"),
+                            thumbnail=thumb_file,
+                            caption=f"Here's your [audio]({url}) >w<",
+                            parse_mode="Markdown",
+                            reply_to_message_id=message.id
+                        )
+                    # Save to DB
+                    dbtools.add_sound(resp.audio.file_id, parsed.post_id, parsed.platform)
+                    react(message, '👌')
+                else:
+                    react(message, '🤯')
             else:
-                bot.set_message_reaction(call.message.chat.id, call.message.id, [ReactionTypeEmoji('🤯')])
-        else:
-            raise FileNotFoundError("Download failed, file not found.")
+                raise FileNotFoundError("Download failed, file not found.")
     except Exception as e:
         logger.error(f"Single video error: {e}")
+        react(message, '😢')
         botTools.send_message_to_admin(bot, ADMIN_USER_ID, "i messed up\n\n" + e.__str__() + "\n\nURL: " + url)
 
-    finally:
-        if file_path.exists():
-            file_path.unlink()
-        if thumb_path.exists():
-            thumb_path.unlink()
-
 
 @bot.callback_query_handler(func=lambda call: True)
 def callback_query(call):
     if call.data.startswith("spoiler"):
-        handle_spoiler_button(call)
+        reply_later(call.message.chat.id, handle_spoiler_button, call)
     elif call.data.startswith("a"):
         handle_audio_button(call)
 
@@ -146,121 +251,252 @@ def echo_all(message):
     # That absolutely huge rat
     if "bigrat.monster" in text.lower():
         if BIGRAT_FILE_ID:
-            bot.send_photo(message.chat.id, BIGRAT_FILE_ID, reply_to_message_id=message.message_id)
+            reply_later(message.chat.id, bot.send_photo, message.chat.id, BIGRAT_FILE_ID,
+                        reply_to_message_id=message.message_id)
         return
 
     if "https://" not in text:
         return
 
-    url = util.extract_https_url(text)
-    if not url:
-        return
+    links = util.parse_urls(text)[:MAX_LINKS_PER_MESSAGE]
+    if links:
+        message_reactions.expect(message.chat.id, message.id, len(links))
+
+    # Downloads are queued first so they start while the cache hits are being sent
+    cached = []
+    for parsed in links:
+        post = get_cached_link(parsed)
+        if post:
+            cached.append((parsed, post))
+        else:
+            try:
+                handle_link(message, parsed)
+            except Exception as e:
+                logger.error(f"Couldn't queue {parsed.url}: {e}")
+                react(message, '😢')
+
+    for parsed, post in cached:
+        metrics.REQUESTS.inc(parsed.platform, "cache_hit")
+        reply_later(message.chat.id, reply_from_cache, message, parsed.url, post)
+
+
+def get_cached_link(parsed: util.ParsedUrl) -> Optional[dbtools.CachedPost]:
+    if parsed.kind == "direct":
+        post = dbtools.get_cached_post(util.direct_url_id(parsed.url), "direct")
+    else:
+        post = dbtools.get_cached_post(parsed.post_id, parsed.platform)
+    return post if post and post.media else None
+
+
+def handle_link(message: Message, parsed: util.ParsedUrl):
+    """Queues the download of a link that isn't cached, or waits on the one already running for the same post."""
+    url = parsed.url
 
     # Separate handling for direct mp4 file URLs
-    if util.check_if_mp4_url(url):
-        process_direct_mp4(message, url)
+    if parsed.kind == "direct":
+        metrics.REQUESTS.inc("direct", "download")
+        download_scheduler.submit("direct", process_direct_mp4, message, url)
         return
 
-    if not util.validate_url(url):
+    key = (parsed.platform, parsed.post_id)
+    # Waiters are answered from their chat's reply queue, the leader's worker doesn't wait on their rate limits
+    if not inflight_downloads.join(
+            key, lambda cached: reply_later(message.chat.id, serve_coalesced_request, message, url, cached)):
+        # Someone else is already downloading this post, we'll be served from the cache when it's done
+        metrics.REQUESTS.inc(parsed.platform, "coalesced")
+        reply_later(message.chat.id, react, message, '👀')
         return
 
-    platform_id = util.get_platform_video_id(url)
-    media_count = dbtools.get_number_of_media_by_platform_id(platform_id)
+    metrics.REQUESTS.inc(parsed.platform, "download")
 
-    if media_count > 0:
-        send_media_from_cache(message, url, platform_id, media_count)
-        return
+    try:
+        download_scheduler.submit(parsed.platform, handle_new_download, message, parsed)
+    except Exception:
+        inflight_downloads.finish(key, None)
+        raise
 
-    if "youtube.com" in url or "youtu.be" in url:
+
+# --- CORE LOGIC ---
+
+def handle_new_download(message: Message, parsed: util.ParsedUrl):
+    """Runs on a download worker, checks the limits that need network access before downloading."""
+    key = (parsed.platform, parsed.post_id)
+    try:
+        with metrics.timed("total", parsed.platform):
+            if parsed.kind == "video":
+                # Cached for the download below, so this is the only metadata request for the video
+                with metrics.timed("probe", parsed.platform):
+                    too_long = util.is_video_longer_than(parsed.canonical_url, 600)  # 10 mins
+                if too_long:
+                    react(message, '🤯')
+                    return
+
+            process_new_download(message, parsed)
+    except Exception as e:
+        logger.error(f"Download of {parsed.url} failed: {e}")
+        react(message, '😢')
+    finally:
         try:
-            yt_url = util.get_yt_video_url(util.get_yt_video_id(url))
-            if util.is_video_longer_than(yt_url, 600):  # 10 mins
-                bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('🤯')])
-                return
-        except Exception:
-            return
+            post = dbtools.get_cached_post(parsed.post_id, parsed.platform)
+        except Exception as e:
+            logger.error(f"Could not read cached post {key}: {e}")
+            post = None
+        inflight_downloads.finish(key, post)
 
-    process_new_download(message, url)
 
+def serve_coalesced_request(message: Message, url: str, post: dbtools.CachedPost):
+    """Answers a request that waited for another download of the same post."""
+    if post and post.media:
+        reply_from_cache(message, url, post)
+    else:
+        react(message, '😢')
 
-# --- CORE LOGIC ---
 
-def process_new_download(message: Message, url: str):
-    """Orchestrates the download of content from supported platforms."""
+def reply_from_cache(message: Message, url: str, post: dbtools.CachedPost):
+    """send_media_from_cache for one link of a message, a failure only costs that link."""
+    try:
+        send_media_from_cache(message, url, post)
+    except Exception as e:
+        logger.error(f"Couldn't send cached {url}: {e}")
+        react(message, '😢')
 
-    is_single_video_platform = any(x in url for x in ["youtube.com", "youtu.be"])
-    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('👀')])
 
-    if is_single_video_platform:
-        filename = util.get_filename(url, "mp4")
-        if filename == "-1":
-            return
+def harvest_audio(parsed: util.ParsedUrl, video_path: Path, info: dict):
+    """Caches the audio of a downloaded video, taken from the file we already have instead of YouTube."""
+    try:
+        # Outlives the video's folder until the upload is done, skipped rather than waited for
+        reserve = video_path.stat().st_size + THUMBNAIL_SCRATCH_BYTES  # The audio is smaller than its video
+        job = scratch_space.acquire(f"harvest-{parsed.post_id}", reserve, timeout=0)
+    except exceptions.ScratchFullException:
+        logger.info(f"No scratch space to keep the audio of {parsed.post_id}")
+        return
 
-        file_path = Path("yt-dlp-downloads/" + filename)
+    submitted = False
+    try:
+        audio_path = job.path / (video_path.stem + "_audio.m4a")
+        if util.extract_audio(str(video_path), str(audio_path), info):
+            upload_executor.submit(upload_harvested_audio, parsed, job, audio_path, info)
+            submitted = True
+    finally:
+        if not submitted:
+            job.release()
 
-        try:
-            # YouTube specific logic to avoid issues with additional data in the url (like playlist info)
-            if "youtu" in url:
-                if util.is_video_longer_than(url, 150):
-                    util.download_video_720(util.get_yt_video_url(util.get_yt_video_id(url)), filename)
-                else:
-                    util.download_video(util.get_yt_video_url(util.get_yt_video_id(url)), filename)
-            else:
-                util.download_video(url, filename)
 
-            # Upload
-            if file_path.exists():
-                if util.is_file_smaller_than_50mb(str(file_path)):
-                    with file_path.open('rb') as video_file:
-                        resp = bot.send_video(
-                            chat_id=message.chat.id,
-                            video=video_file,
-                            supports_streaming=True,
-                            caption=f"Here's your [video]({url}) >w<",
-                            parse_mode="Markdown",
-                            reply_to_message_id=message.message_id,
-                            reply_markup=botTools.gen_spoiler_markup_with_audio(util.get_platform_video_id(url))
-                        )
-                    # Save to DB
-                    dbtools.add_video(resp.video.file_id, util.get_platform_video_id(url), util.get_platform(url))
-                    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('👌')])
+def upload_harvested_audio(parsed: util.ParsedUrl, job: scratch.ScratchDir, audio_path: Path, info: dict):
+    thumb_path = util.download_thumbnail(info, str(audio_path.with_suffix("")))
+
+    try:
+        with audio_path.open('rb') as audio_file, \
+                (open(thumb_path, 'rb') if thumb_path else nullcontext()) as thumb_file:
+            resp = bot.send_audio(
+                PRIVATE_CHANNEL_ID,
+                audio=audio_file,
+                title=info.get("track") or info.get("title"),
+                performer=info.get("artist") or info.get("uploader"),
+                thumbnail=thumb_file
+            )
+        dbtools.add_sound(resp.audio.file_id, parsed.post_id, parsed.platform)
+    except Exception as e:
+        logger.error(f"Audio upload error: {e}")
+    finally:
+        job.release()
+
+
+def process_new_download(message: Message, parsed: util.ParsedUrl):
+    """Orchestrates the download of content from supported platforms."""
+    url = parsed.url
+
+    react(message, '👀')
+
+    if parsed.kind == "video":
+        try:
+            with scratch_space.acquire(f"{parsed.platform}-{parsed.post_id}", VIDEO_SCRATCH_BYTES) as job:
+                file_path = job.path / util.get_parsed_filename(parsed, "mp4")
+
+                # The canonical URL avoids issues with additional data in the url (like playlist info)
+                probe = util.probe_video(parsed.canonical_url)
+                with metrics.timed("download", parsed.platform):
+                    if util.is_video_longer_than(parsed.canonical_url, 150):
+                        info = util.download_video_720(parsed.canonical_url, str(file_path), probe)
+                    else:
+                        info = util.download_video(parsed.canonical_url, str(file_path), probe)
+
+                # Upload
+                if file_path.exists():
+                    if util.is_file_smaller_than_50mb(str(file_path)):
+                        with metrics.timed("send", parsed.platform), file_path.open('rb') as video_file:
+                            resp = bot.send_video(
+                                chat_id=message.chat.id,
+                                video=video_file,
+                                supports_streaming=True,
+                                caption=f"Here's your [video]({url}) >w<",
+                                parse_mode="Markdown",
+                                reply_to_message_id=message.message_id,
+                                reply_markup=botTools.gen_spoiler_markup_with_audio(parsed.post_id)
+                            )
+                        # Save to DB
+                        with metrics.timed("db", parsed.platform):
+                            dbtools.add_video(resp.video.file_id, parsed.post_id, parsed.platform)
+                        react(message, '👌')
+
+                        if KEEP_VIDEO_AUDIO and parsed.platform == "youtube":
+                            harvest_audio(parsed, file_path, info or probe.info)
+                    else:
+                        error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
+                        react(message, '🤯')
+                        botTools.safe_delete(bot, error_msg, 3)
                 else:
-                    error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
-                    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('🤯')])
-                    botTools.safe_delete(bot, error_msg, 3)
-            else:
-                raise FileNotFoundError("Download failed, file not found.")
+                    raise FileNotFoundError("Download failed, file not found.")
 
+        except exceptions.FileTooBigException:
+            # Every format was too big according to the probe, nothing was downloaded
+            error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
+            react(message, '🤯')
+            botTools.safe_delete(bot, error_msg, 3)
         except Exception as e:
             logger.error(f"Single video error: {e}")
             error_msg = botTools.send_error_msg(bot, message, SAD_TORO_FILE_ID)
-            bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('😢')])
+            react(message, '😢')
 
             botTools.safe_delete(bot, error_msg, 3)
             botTools.send_message_to_admin(bot, ADMIN_USER_ID, "i messed up\n\n" + e.__str__() + "\n\nURL: " + url)
-
-        finally:
-            if file_path.exists():
-                file_path.unlink()
     else:
         try:
-            process_gallery_download(message, url)
+            if parsed.platform in URL_UPLOAD_PLATFORMS and send_photo_by_url(message, parsed):
+                react(message, '👌')
+                return
+
+            # Photo only sites get a folder in RAM when there's one with room
+            in_ram = parsed.platform in RAM_SCRATCH_PLATFORMS
+            with scratch_space.acquire(f"{parsed.platform}-{parsed.post_id}",
+                                       util.MAX_FILE_SIZE if in_ram else GALLERY_SCRATCH_BYTES, ram=in_ram) as job:
+                process_gallery_download(message, parsed, job)
         except exceptions.FileTooBigException:
             error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
-            bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('🤯')])
+            react(message, '🤯')
+            botTools.safe_delete(bot, error_msg, 3)
+        except exceptions.ScratchQuotaException:
+            # Every file fits Telegram, the post is only bigger than what a job may reserve
+            logger.warning(f"{url} is over the gallery scratch quota")
+            error_msg = botTools.send_error_msg(bot, message, SAD_TORO_FILE_ID)
+            react(message, '😢')
             botTools.safe_delete(bot, error_msg, 3)
+            botTools.send_message_to_admin(bot, ADMIN_USER_ID, "Post over the gallery scratch quota, raise "
+                                           f"GALLERY_SCRATCH_MB ({GALLERY_SCRATCH_BYTES >> 20} MB)\n\nURL: {url}")
         except Exception as e:
             logger.error(f"Gallery routine error: {e}")
+            react(message, '😢')
             botTools.send_message_to_admin(bot, ADMIN_USER_ID, "i messed up\n\n" + e.__str__() + "\n\nURL: " + url)
 
 
-def send_audio_from_cache(message: Message, url: str, platform_id: str) -> bool:
-    row = dbtools.get_first_sound(platform_id)
+def send_audio_from_cache(message: Message, parsed: util.ParsedUrl) -> bool:
+    url = parsed.canonical_url
+    post = dbtools.get_cached_post(parsed.post_id, parsed.platform)
 
-    if not row:
+    if not post or not post.audio_file_id:
         return False
 
-    audio_file_id = row[0]
+    audio_file_id = post.audio_file_id
 
     bot.send_audio(message.chat.id,
                    audio=audio_file_id,
@@ -271,19 +507,17 @@ def send_audio_from_cache(message: Message, url: str, platform_id: str) -> bool:
     return True
 
 
-def send_media_from_cache(message: Message, url: str, platform_id: str, count: int):
+def send_media_from_cache(message: Message, url: str, post: dbtools.CachedPost):
     """Handles sending media that already exists in the database."""
-    if dbtools.get_number_of_descriptions_by_platform_id(platform_id) > 0:
-        caption = "<blockquote>" + dbtools.get_first_description(platform_id)[
-            0] + "</blockquote>\n" + f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
+    platform_name = post.platform
+
+    if post.description is not None:
+        caption = "<blockquote>" + post.description + "</blockquote>\n" + f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
     else:
         caption = f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
 
-    _, _, platform_name, _ = dbtools.get_first_media(platform_id)
-
-    if count == 1 or platform_name == "youtube":
-        media_data = dbtools.get_first_media(platform_id)
-        file_id, _, _, media_type = media_data
+    if len(post.media) == 1 or platform_name == "youtube":
+        file_id, media_type = post.media[0]
 
         if media_type == "photo":
             bot.send_photo(message.chat.id, file_id, caption=caption,
@@ -297,19 +531,21 @@ def send_media_from_cache(message: Message, url: str, platform_id: str, count: i
                 bot.send_video(message.chat.id, file_id, caption=caption,
                                supports_streaming=True, parse_mode="HTML",
                                reply_to_message_id=message.message_id,
-                               reply_markup=botTools.gen_spoiler_markup_with_audio(util.get_platform_video_id(url)))
+                               reply_markup=botTools.gen_spoiler_markup_with_audio(post.platform_id))
             else:
                 bot.send_video(message.chat.id, file_id, caption=caption,
                                supports_streaming=True, parse_mode="HTML",
                                reply_to_message_id=message.message_id,
                                reply_markup=botTools.gen_spoiler_markup())
+
+        # YouTube audio is only sent through the "Download Audio" button
+        if post.audio_file_id and platform_name != "youtube":
+            bot.send_audio(message.chat.id, audio=post.audio_file_id, reply_to_message_id=message.message_id)
     else:
         # Multi-media handling (Albums)
-        all_media = dbtools.get_all_media(platform_id)
         input_media_list = []
 
-        for index, row in enumerate(all_media):
-            file_id, _, _, media_type = row
+        for index, (file_id, media_type) in enumerate(post.media):
             # Only the first item gets the caption
             current_caption = caption if index == 0 else None
 
@@ -326,110 +562,152 @@ def send_media_from_cache(message: Message, url: str, platform_id: str, count: i
             bot.send_media_group(message.chat.id, media=chunk, reply_to_message_id=message.message_id)
 
         # Send Audio if exists
-        audio_data = dbtools.get_first_sound(platform_id)
-        if audio_data:
-            bot.send_audio(message.chat.id, audio=audio_data[0], reply_to_message_id=message.message_id)
+        if post.audio_file_id:
+            bot.send_audio(message.chat.id, audio=post.audio_file_id, reply_to_message_id=message.message_id)
 
-    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('👌')])
+    react(message, '👌')
 
 
 def process_direct_mp4(message: Message, url: str):
     """Downloads and sends a direct MP4 link."""
-    filename = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '.mp4'
-    file_path = Path(filename)
+    react(message, '👀')
 
-    if util.check_if_mp4_url_is_larger_than_50mb(url):
-        error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
-        bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('🤯')])
+    reply = dict(
+        supports_streaming=True,
+        caption=f"Here's your [video]({url}) >w<",
+        parse_mode="Markdown",
+        reply_to_message_id=message.message_id
+    )
 
-        botTools.safe_delete(bot, error_msg, 3)
-        return
+    try:
+        # Small enough files are fetched by Telegram itself, the rest goes through our disk
+        resp = sender.send_by_url(bot, "video", message.chat.id, url, httpclient.remote_size(url), **reply)
 
-    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('👀')])
+        if resp is None:
+            with scratch_space.acquire("direct", util.MAX_FILE_SIZE) as job:
+                file_path = job.path / "video.mp4"
+                util.download_direct_mp4(url, str(file_path))
 
-    try:
-        urllib.request.urlretrieve(url, filename)
-
-        with file_path.open('rb') as video_file:
-            bot.send_video(
-                chat_id=message.chat.id,
-                video=video_file,
-                supports_streaming=True,
-                caption=f"Here's your [video]({url}) >w<",
-                parse_mode="Markdown",
-                reply_to_message_id=message.message_id
-            )
+                with file_path.open('rb') as video_file:
+                    resp = bot.send_video(message.chat.id, video_file, **reply)
 
+        media_type, file_id = sender.sent_media(resp, "video")
+        if media_type == "video":
+            dbtools.add_video(file_id, util.direct_url_id(url), "direct")
+        else:
+            dbtools.add_gif(file_id, util.direct_url_id(url), "direct")
+        react(message, '👌')
 
+    except exceptions.FileTooBigException:
+        error_msg = botTools.send_too_big_msg(bot, message, SAD_TORO_FILE_ID)
+        react(message, '🤯')
+        botTools.safe_delete(bot, error_msg, 3)
     except Exception as e:
         logger.error(f"Direct download error: {e}")
         error_msg = botTools.send_error_msg(bot, message, SAD_TORO_FILE_ID)
-        bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('😢')])
+        react(message, '😢')
         botTools.safe_delete(bot, error_msg, 3)
         botTools.send_message_to_admin(bot, ADMIN_USER_ID, "i messed up (yt-dlp)\n\n" + e.__str__() + "\n\nURL: " + url)
-    finally:
-        if file_path.exists():
-            file_path.unlink()
 
 
-def process_gallery_download(message: Message, url: str):
-    """Handles URLs with multiple photos and videos, uses gallery-dl."""
-    if "instagram.com" in url:
+def upload_to_private_channel(f: Path) -> tuple:
+    """Uploads one album file to the private channel, returns its media type and file_id."""
+    with f.open('rb') as file_obj:
+        if f.suffix in ['.webp', '.jpg', '.png']:
+            msg = bot.send_photo(PRIVATE_CHANNEL_ID, file_obj)
+            return "photo", msg.photo[-1].file_id
+        elif f.suffix == '.gif':
+            msg = bot.send_document(PRIVATE_CHANNEL_ID, file_obj)
+            return "gif", msg.document.file_id
+        else:
+            msg = bot.send_video(PRIVATE_CHANNEL_ID, file_obj)
+            return "video", msg.video.file_id
+
+
+def download_gallery(parsed: util.ParsedUrl, job: scratch.ScratchDir):
+    """Runs gallery-dl into the job's folder, within its reservation."""
+    with metrics.timed("download", parsed.platform):
+        util.download_media(parsed, str(job.path), max_total=job.reserved)
+
+
+def send_photo_by_url(message: Message, parsed: util.ParsedUrl) -> bool:
+    """Single image posts are fetched by Telegram straight from the site, False means gallery-dl has to do it."""
+    try:
+        resolved = util.resolve_single_photo(parsed)
+    except Exception as e:
+        logger.info(f"Couldn't resolve {parsed.url}: {e}")
+        return False
+
+    if resolved is None:
+        return False
+
+    photo_url, size = resolved
+    resp = sender.send_by_url(bot, "photo", message.chat.id, photo_url, size,
+                              caption=f'Here\'s your <a href="{parsed.url}">media</a> &gt;w&lt;', parse_mode="HTML",
+                              reply_markup=botTools.gen_spoiler_markup(), reply_to_message_id=message.message_id)
+    if resp is None:
+        return False
+
+    dbtools.add_photo(sender.file_id_of(resp, "photo"), parsed.post_id, parsed.platform)
+    return True
+
+
+def process_gallery_download(message: Message, parsed: util.ParsedUrl, job: scratch.ScratchDir):
+    """Handles URLs with multiple photos and videos, uses gallery-dl. Files go in job, which the caller releases."""
+    url = parsed.url
+
+    if parsed.platform == "instagram":
         try:
-            caption = ig_extractor.download_media_embed(util.get_ig_video_id(url))
+            with metrics.timed("embed_download", parsed.platform):
+                caption = ig_extractor.download_media_embed(parsed.post_id, str(job.path), max_total=job.reserved)
             already_have_caption = True
+        except (exceptions.FileTooBigException, exceptions.ScratchQuotaException):
+            raise  # gallery-dl would only fetch the same oversized files again
         except Exception as e:
-            shutil.rmtree(f"media-downloads/instagram/{util.get_ig_video_id(url)}")
+            job.clear()
             already_have_caption = False
-            util.download_media(url)
+            download_gallery(parsed, job)
     else:
         already_have_caption = False
-        util.download_media(url)
+        download_gallery(parsed, job)
 
-    platform_name = util.get_platform(url)
-    video_id = util.get_platform_video_id(url)
-    download_path = TEMP_DIR / platform_name / video_id
+    platform_name = parsed.platform
+    video_id = parsed.post_id
+    download_path = job.path
     description_tag = util.get_description_tag(platform_name)
 
-    if not download_path.exists():
+    files = [f for f in download_path.iterdir() if f.name.startswith(video_id)]
+    files = util.naturally_sort_filenames(files)
+
+    if not files:
         botTools.send_message_to_admin(bot, ADMIN_USER_ID, "i messed up (gallery-dl)\n\nURL: " + url)
-        bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('😢')])
+        react(message, '😢')
         # util.delete_dead_ig_cookies()
         return
 
-    files = [f for f in download_path.iterdir() if f.name.startswith(video_id)]
-    files = util.naturally_sort_filenames(files)
-
     if not util.is_arr_smaller_than_50mb(files):
         logger.warning(f"Files are bigger than 50mb")
-        shutil.rmtree(download_path)
         raise exceptions.FileTooBigException()
 
     media_items = []
 
     media_files = [f for f in files if f.suffix in ['.webp', '.jpg', '.png', '.mp4', '.gif']]
 
-    for f in media_files:
-        is_photo = f.suffix in ['.webp', '.jpg', '.png']
-        with f.open('rb') as file_obj:
-            if is_photo:
-                msg = bot.send_photo(PRIVATE_CHANNEL_ID, file_obj)
-                file_id = msg.photo[-1].file_id
-                dbtools.add_photo(file_id, video_id, platform_name)
-                media_items.append(InputMediaPhoto(file_id))
-            elif f.suffix == '.gif':
-                msg = bot.send_document(PRIVATE_CHANNEL_ID, file_obj)
-                file_id = msg.document.file_id
-                dbtools.add_gif(file_id, video_id, platform_name)
-                media_items.append(InputMediaDocument(file_id))
-            else:
-                msg = bot.send_video(PRIVATE_CHANNEL_ID, file_obj)
-                file_id = msg.video.file_id
-                dbtools.add_video(file_id, video_id, platform_name)
-                media_items.append(InputMediaVideo(file_id, supports_streaming=True))
+    # map keeps the files' order, so the album and the DB rows come out as they were downloaded
+    with metrics.timed("upload", platform_name):
+        uploads = list(upload_executor.map(upload_to_private_channel, media_files))
+
+    for media_type, file_id in uploads:
+        if media_type == "photo":
+            media_items.append(InputMediaPhoto(file_id))
+        elif media_type == "gif":
+            media_items.append(InputMediaDocument(file_id))
+        else:
+            media_items.append(InputMediaVideo(file_id, supports_streaming=True))
 
     # Add caption to first item
     if media_items:
+        stored_description = None
         metadata_files = [f for f in files if f.suffix in ['.txt']]
 
         if len(metadata_files) != 0:
@@ -446,7 +724,7 @@ def process_gallery_download(message: Message, url: str):
                     media_items[0].caption = "<blockquote>" + html.escape(
                         description) + "</blockquote>\n" + f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
 
-                dbtools.add_description(description, video_id, platform_name)
+                stored_description = description
             except Exception as e:
                 print("DIOCANEPORCO\n" + e.__str__())
                 media_items[0].caption = f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
@@ -458,24 +736,31 @@ def process_gallery_download(message: Message, url: str):
 
                 media_items[
                     0].caption = "<blockquote>" + caption + "</blockquote>\n" + f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
-                dbtools.add_description(caption, video_id, platform_name)
+                stored_description = caption
             else:
                 media_items[0].caption = f'Here\'s your <a href="{url}">media</a> &gt;w&lt;'
 
         media_items[0].parse_mode = "HTML"
 
-        if len(media_files) == 1 and (
-                isinstance(media_items[0], InputMediaPhoto) or isinstance(media_items[0], InputMediaVideo)):
-            if isinstance(media_items[0], InputMediaPhoto):
-                bot.send_photo(message.chat.id, media_items[0].media, media_items[0].caption, parse_mode="HTML",
-                               reply_markup=botTools.gen_spoiler_markup(), reply_to_message_id=message.message_id)
+        # The whole album goes in at once, so the cache never holds part of it
+        with metrics.timed("db", platform_name):
+            dbtools.add_album([(file_id, media_type) for media_type, file_id in uploads], video_id, platform_name,
+                              stored_description)
+
+        with metrics.timed("send", platform_name):
+            if len(media_files) == 1 and (
+                    isinstance(media_items[0], InputMediaPhoto) or isinstance(media_items[0], InputMediaVideo)):
+                if isinstance(media_items[0], InputMediaPhoto):
+                    bot.send_photo(message.chat.id, media_items[0].media, media_items[0].caption, parse_mode="HTML",
+                                   reply_markup=botTools.gen_spoiler_markup(), reply_to_message_id=message.message_id)
+                else:
+                    bot.send_video(message.chat.id, media_items[0].media, caption=media_items[0].caption,
+                                   parse_mode="HTML", reply_markup=botTools.gen_spoiler_markup(),
+                                   reply_to_message_id=message.message_id)
             else:
-                bot.send_video(message.chat.id, media_items[0].media, caption=media_items[0].caption, parse_mode="HTML",
-                               reply_markup=botTools.gen_spoiler_markup(), reply_to_message_id=message.message_id)
-        else:
-            # Send in groups of 10, since it's the maximum that Telegram allows.
-            for chunk in util.chunk_list(media_items, 10):
-                bot.send_media_group(message.chat.id, media=chunk, reply_to_message_id=message.message_id)
+                # Send in groups of 10, since it's the maximum that Telegram allows.
+                for chunk in util.chunk_list(media_items, 10):
+                    bot.send_media_group(message.chat.id, media=chunk, reply_to_message_id=message.message_id)
 
     audio_files = [f for f in files if f.suffix == '.mp3']
     if audio_files:
@@ -485,24 +770,37 @@ def process_gallery_download(message: Message, url: str):
             dbtools.add_sound(file_id, video_id, platform_name)
             bot.send_audio(message.chat.id, file_id, reply_to_message_id=message.message_id)
 
-    # Delete files
-    shutil.rmtree(download_path)
+    react(message, '👌')
 
-    bot.set_message_reaction(message.chat.id, message.id, [ReactionTypeEmoji('👌')])
+
+def log_versions():
+    logger.info("Bot running on " + platform.platform())
+    # From the package metadata, importing yt-dlp here would undo its lazy loading
+    logger.info("Using yt-dlp: " + metadata.version("yt-dlp"))
 
 
 # --- Entry Point ---
 
 if __name__ == '__main__':
     try:
-        logger.info("Bot running on " + platform.platform())
-        logger.info("Using yt-dlp: " + yt_dlp.version.__version__)
+        log_versions()
         logger.info("Bot started...")
         botTools.send_message_to_admin(bot, ADMIN_USER_ID, "I'm alive!")
-        bot.infinity_polling()
+        util.ig_cookies.start_background_checks()
+        if METRICS_PORT:
+            metrics.start_server(METRICS_PORT)
+
+        if BOT_MODE == "webhook":
+            server = webhook.WebhookServer(bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+            if WEBHOOK_URL:
+                bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+            server.serve_forever()
+        else:
+            bot.remove_webhook()  # Telegram refuses getUpdates while a webhook is set
+            bot.infinity_polling()
     except KeyboardInterrupt:
         logger.info("Bot stopped by user.")
     except Exception as e:
         logger.critical(f"Critical error: {e}")
-
-bot.infinity_polling()
+    finally:
+        ytdl_engine.engine.close()  # Writes back cookies updated by the warm instances
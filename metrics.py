@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)  # Seconds
+_INF = 'le="+Inf"'
+
+_metrics: List["_Metric"] = []
+_metrics_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _metrics_lock:
+            _metrics.append(self)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """The metric's lines in the text format, without HELP and TYPE."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+                    for labels, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}  # labels -> [count per bucket..., sum, count]
+
+    def observe(self, value: float, *labelvalues):
+        with self._lock:
+            state = self._values.setdefault(labelvalues, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, *labelvalues) -> int:
+        with self._lock:
+            state = self._values.get(labelvalues)
+            return state[-1] if state else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for labels, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, _INF)} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+class Callback(_Metric):
+    """A value read from somewhere else when scraped, fn returns a number or {label values: number}."""
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], Union[float, Dict[tuple, float]]],
+                 kind: str = "gauge", labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            logger.error(f"Couldn't collect {self.name}: {e}")
+            return []
+
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+                for labels, value in sorted(values.items())]
+
+
+STAGE_SECONDS = Histogram("torodl_stage_seconds", "Time spent in each pipeline stage.", ("stage", "platform"))
+FAILURES = Counter("torodl_failures_total", "Failed pipeline stages by exception type.",
+                   ("stage", "platform", "type"))
+REQUESTS = Counter("torodl_requests_total", "Links received, by how they were served.", ("platform", "result"))
+
+
+@contextmanager
+def timed(stage: str, platform: str):
+    """Records how long the block took, and the exception type if it failed."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        FAILURES.inc(stage, platform, type(e).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage, platform)
+
+
+def unregister(metric: _Metric):
+    """Takes a metric out of render(), for metrics that only live as long as their owner (and tests)."""
+    with _metrics_lock:
+        if metric in _metrics:
+            _metrics.remove(metric)
+
+
+def render() -> str:
+    """Every metric in the Prometheus text format."""
+    with _metrics_lock:
+        metrics = list(_metrics)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,207 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limits: about 30 messages/s overall, 1/s in a private chat and 20/min in a group
+GLOBAL_RATE = (30, 30)  # Tokens per second, burst
+PRIVATE_CHAT_RATE = (1, 3)
+GROUP_CHAT_RATE = (20 / 60, 20)
+# Reactions and deletions don't post anything, they get their own allowance per chat instead of the message one
+LIGHT_CHAT_RATE = (2, 10)
+
+# Lower goes first when requests are waiting for the global bucket
+PRIORITY_REPLY = 0
+PRIORITY_REACTION = 1
+PRIORITY_ADMIN = 2
+
+# Not messages, these never count against the limits
+UNTHROTTLED = {"getUpdates", "getMe", "getFile", "answerCallbackQuery", "setWebhook", "deleteWebhook"}
+LIGHT = {"setMessageReaction", "deleteMessage"}
+
+MAX_CHAT_BUCKETS = 4096
+
+
+class TokenBucket:
+    """Classic token bucket, not thread safe on its own: RateLimiter guards it with its lock."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if there's one now."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        """Used for retry_after: nothing goes out before until, then only one request before the normal pace."""
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = min(self.capacity, 1)
+        self.updated = self.blocked_until
+
+
+def _default_request(method, url, **kwargs):
+    return apihelper._get_req_session().request(method, url, **kwargs)
+
+
+def _retry_after(response) -> float:
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+def _rewind(files: Optional[dict]):
+    """Uploads read their files to the end, they have to start over on a retry."""
+    for value in (files or {}).values():
+        file = value[1] if isinstance(value, tuple) else value
+        if hasattr(file, "seek"):
+            file.seek(0)
+
+
+class RateLimiter:
+    """Paces every Bot API request with a global token bucket and one bucket per chat.
+
+    Requests wait for a token instead of failing, waiting requests get the global bucket in priority
+    order (user replies, then reactions, then admin notices), and 429s are retried after retry_after.
+    """
+
+    def __init__(self, admin_chat_id: Optional[str] = None, global_rate: Tuple[float, float] = GLOBAL_RATE,
+                 chat_rates: Optional[Dict[str, Tuple[float, float]]] = None, max_retries: int = 3,
+                 request: Callable = _default_request, clock: Callable[[], float] = time.monotonic):
+        self.admin_chat_id = str(admin_chat_id) if admin_chat_id is not None else None
+        self.chat_rates = {str(k): v for k, v in (chat_rates or {}).items()}
+        self.max_retries = max_retries
+        self._request = request
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._global = TokenBucket(*global_rate, clock())
+        self._chats: "OrderedDict[Tuple[str, bool], TokenBucket]" = OrderedDict()  # (chat id, light) -> bucket
+        self._waiting: Dict[Tuple[int, int], Tuple[Optional[str], bool]] = {}  # (priority, seq) -> (chat id, light)
+        self._seq = itertools.count()
+
+        self.sent = 0
+        self.throttled = 0  # Requests that had to wait for a token
+        self.retried = 0  # 429s from Telegram
+
+    def _chat_bucket(self, chat_id: Optional[str], light: bool = False) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+
+        key = (chat_id, light)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if light:
+                rate = LIGHT_CHAT_RATE
+            elif chat_id in self.chat_rates:
+                rate = self.chat_rates[chat_id]
+            else:
+                rate = GROUP_CHAT_RATE if chat_id.startswith("-") else PRIVATE_CHAT_RATE
+            bucket = self._chats[key] = TokenBucket(*rate, self._clock())
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(key)
+        return bucket
+
+    def classify(self, method_name: str, chat_id: Optional[str]) -> int:
+        if chat_id is not None and chat_id == self.admin_chat_id:
+            return PRIORITY_ADMIN
+        if method_name == "setMessageReaction":
+            return PRIORITY_REACTION
+        return PRIORITY_REPLY
+
+    def _ready(self, chat_id: Optional[str], light: bool, now: float) -> float:
+        bucket = self._chat_bucket(chat_id, light)
+        return bucket.delay(now) if bucket else 0.0
+
+    def acquire(self, chat_id: Optional[str], priority: int = PRIORITY_REPLY, light: bool = False) -> bool:
+        """Blocks until the request may go out, returns whether it had to wait."""
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            self._waiting[ticket] = (chat_id, light)
+            waited = False
+            try:
+                while True:
+                    now = self._clock()
+                    wait = max(self._global.delay(now), self._ready(chat_id, light, now))
+                    # A more urgent request that could go right now gets the global token first
+                    ahead = any(other < ticket and self._ready(*other_key, now) <= 0
+                                for other, other_key in self._waiting.items())
+                    if wait <= 0 and not ahead:
+                        self._global.take(now)
+                        bucket = self._chat_bucket(chat_id, light)
+                        if bucket:
+                            bucket.take(now)
+                        if waited:
+                            self.throttled += 1
+                        return waited
+
+                    waited = True
+                    self._cond.wait(wait if wait > 0 else 0.05)
+            finally:
+                del self._waiting[ticket]
+                self._cond.notify_all()
+
+    def penalize(self, chat_id: Optional[str], retry_after: float, light: bool = False):
+        with self._cond:
+            until = self._clock() + retry_after
+            bucket = self._chat_bucket(chat_id, light) or self._global
+            bucket.block(until)
+
+    def send(self, method, url, params=None, files=None, **kwargs):
+        """Drop-in for apihelper.CUSTOM_REQUEST_SENDER."""
+        method_name = url.rsplit("/", 1)[-1]
+        if method_name in UNTHROTTLED:
+            return self._request(method, url, params=params, files=files, **kwargs)
+
+        chat_id = params.get("chat_id") if params else None
+        chat_id = str(chat_id) if chat_id is not None else None
+        priority = self.classify(method_name, chat_id)
+        light = method_name in LIGHT
+
+        attempt = 0
+        while True:
+            self.acquire(chat_id, priority, light)
+            response = self._request(method, url, params=params, files=files, **kwargs)
+            with self._cond:
+                self.sent += 1
+
+            if response.status_code != 429 or attempt >= self.max_retries:
+                return response
+
+            attempt += 1
+            retry_after = _retry_after(response)
+            with self._cond:
+                self.retried += 1
+            logger.warning(f"429 on {method_name} for chat {chat_id}, retrying in {retry_after}s")
+            self.penalize(chat_id, retry_after, light)
+            _rewind(files)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"sent": self.sent, "throttled": self.throttled, "retried": self.retried}
+
+
+def install(limiter: RateLimiter):
+    """Routes every request telebot makes through the limiter."""
+    apihelper.CUSTOM_REQUEST_SENDER = limiter.send
@@ -0,0 +1,69 @@
+import logging
+import threading
+from typing import Callable, Hashable
+
+from lrucache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+WORKING = '👀'
+# Worst last, a message with several links shows the worst of their results
+RESULTS = ['👌', '🤯', '😢']
+
+
+class _MessageState:
+    def __init__(self, links: int):
+        self.lock = threading.Lock()
+        self.remaining = links
+        self.result = None
+        self.working = False
+
+
+class MessageReactions:
+    """Turns the reactions of every link in a message into one: 👀 once the first one starts, then the worst result
+    when the last one is done, so links that finish early don't cover up a failure.
+
+    Messages that weren't announced with expect() get every reaction as it comes.
+    """
+
+    def __init__(self, set_reaction: Callable[[int, int, str], None], maxsize: int = 1024, ttl: float = 3600):
+        self._set_reaction = set_reaction
+        self._messages = LRUCache(maxsize, ttl)
+
+    def expect(self, chat_id: int, message_id: int, links: int):
+        """Announces how many links of the message will report a result."""
+        self._messages.put(self._key(chat_id, message_id), _MessageState(links))
+
+    def react(self, chat_id: int, message_id: int, emoji: str):
+        state = self._messages.get(self._key(chat_id, message_id))
+        if state is None or emoji not in RESULTS + [WORKING]:
+            self._send(chat_id, message_id, emoji)
+            return
+
+        # Held while reacting, so a late 👀 can't land on top of the result
+        with state.lock:
+            if emoji == WORKING:
+                if state.working or state.remaining <= 0:
+                    return
+                state.working = True
+            else:
+                if state.remaining <= 0:
+                    return
+                state.remaining -= 1
+                if state.result is None or RESULTS.index(emoji) > RESULTS.index(state.result):
+                    state.result = emoji
+                if state.remaining:
+                    return
+                emoji = state.result
+            self._send(chat_id, message_id, emoji)
+
+    def _send(self, chat_id: int, message_id: int, emoji: str):
+        # Only a reaction, it failing shouldn't fail the reply that came with it
+        try:
+            self._set_reaction(chat_id, message_id, emoji)
+        except Exception as e:
+            logger.error(f"Couldn't react {emoji} to {message_id} in {chat_id}: {e}")
+
+    @staticmethod
+    def _key(chat_id: int, message_id: int) -> Hashable:
+        return chat_id, message_id
@@ -0,0 +1,124 @@
+import collections
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLATFORM_LIMIT = 2
+
+
+def parse_platform_limits(spec: str) -> Dict[str, int]:
+    """Parses a "platform=limit,platform=limit" string into a dict."""
+    limits = {}
+    if not spec:
+        return limits
+
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        limits[name.strip()] = int(value)
+
+    return limits
+
+
+class _Job:
+    __slots__ = ("platform", "fn", "args", "kwargs", "future")
+
+    def __init__(self, platform: str, fn: Callable, args: tuple, kwargs: dict):
+        self.platform = platform
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class DownloadScheduler:
+    """Runs download jobs on a pool of workers, capping how many jobs of each platform run at once."""
+
+    def __init__(self, workers: int = 4, platform_limits: Optional[Dict[str, int]] = None,
+                 default_limit: int = DEFAULT_PLATFORM_LIMIT):
+        self.workers = max(1, workers)
+        self.platform_limits = dict(platform_limits or {})
+        self.default_limit = max(1, default_limit)
+
+        self._pending = collections.deque()
+        self._running = collections.Counter()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+    def limit_for(self, platform: str) -> int:
+        return max(1, self.platform_limits.get(platform, self.default_limit))
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"download-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, platform: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) as a job for the given platform."""
+        job = _Job(platform, fn, args, kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            self._pending.append(job)
+            self._cond.notify()
+        return job.future
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def running(self, platform: Optional[str] = None) -> int:
+        with self._cond:
+            if platform is None:
+                return sum(self._running.values())
+            return self._running[platform]
+
+    def _take_next(self) -> Optional[_Job]:
+        # Oldest job whose platform still has a free slot, so a busy platform never blocks the others
+        for job in self._pending:
+            if self._running[job.platform] < self.limit_for(job.platform):
+                self._pending.remove(job)
+                self._running[job.platform] += 1
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._take_next()
+                while job is None:
+                    if self._shutdown and not self._pending:
+                        return
+                    self._cond.wait()
+                    job = self._take_next()
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        logger.error(f"Job for {job.platform} failed: {e}")
+                        job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[job.platform] -= 1
+                    if not self._running[job.platform]:
+                        del self._running[job.platform]  # Keys can be chat ids, don't keep one per chat forever
+                    self._cond.notify_all()
@@ -0,0 +1,122 @@
+import itertools
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import exceptions
+
+ADMISSION_TIMEOUT = 600  # Seconds a job waits for space before giving up
+PREFIX = "torodl-"  # Only directories named like this are ever deleted, the roots may be shared (e.g. /dev/shm)
+
+
+class ScratchDir:
+    """The private directory of one job, deleted and its reservation freed on release."""
+
+    def __init__(self, space: "ScratchSpace", path: Path, reserved: int, ram: bool):
+        self.space = space
+        self.path = path
+        self.reserved = reserved
+        self.ram = ram
+        self._released = False
+
+    def __enter__(self) -> "ScratchDir":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def clear(self):
+        """Empties the directory, for a job that starts over with another downloader."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def release(self):
+        """Safe to call more than once, only the first call does anything."""
+        if self._released:
+            return
+        self._released = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.space._free(self)
+
+
+class ScratchSpace:
+    """Hands out one directory per job, keeping the bytes reserved by running jobs under a quota.
+
+    Jobs reserve their worst case up front and wait when it doesn't fit. The reservation is also the job's byte
+    cap, which its downloaders enforce (max_total), so running jobs can't write more than the quota together.
+    Jobs that ask for it get a directory in ram_root (a tmpfs) when it has room.
+    """
+
+    def __init__(self, root: str, quota: int, ram_root: Optional[str] = None, ram_quota: int = 0):
+        self.root = Path(root)
+        self.quota = quota
+        self.ram_root = Path(ram_root) if ram_root else None
+        self.ram_quota = ram_quota if ram_root else 0
+
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._ram_reserved = 0
+        self._jobs = 0
+        self._waiting = 0
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        """Deletes the job directories the last run left behind, and nothing else."""
+        for root in [self.root, self.ram_root]:
+            if root is not None and root.is_dir():
+                for path in root.glob(PREFIX + "*"):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def acquire(self, name: str, reserve: int, ram: bool = False,
+                timeout: Optional[float] = ADMISSION_TIMEOUT) -> ScratchDir:
+        """Creates a directory for a job that will write at most reserve bytes, waiting until they fit.
+
+        The job's downloads have to stay under job.reserved, which is reserve clamped to the quota.
+        ram only asks for RAM, the job gets a disk directory if ram_root is full or not configured.
+        Raises ScratchFullException if there's still no room after timeout seconds.
+        """
+        reserve = min(reserve, self.quota)  # A job bigger than the quota still gets to run, alone
+
+        with self._cond:
+            if ram and self._ram_reserved + reserve <= self.ram_quota:
+                self._ram_reserved += reserve
+                root, in_ram = self.ram_root, True
+            else:
+                self._waiting += 1
+                try:
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while self._reserved + reserve > self.quota:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise exceptions.ScratchFullException(f"No room for {name} in {self.root}")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                self._reserved += reserve
+                root, in_ram = self.root, False
+            self._jobs += 1
+            path = root / f"{PREFIX}{name}-{next(self._ids)}"
+
+        job = ScratchDir(self, path, reserve, in_ram)
+        try:
+            path.mkdir(parents=True, exist_ok=True)
+        except BaseException:
+            job.release()
+            raise
+        return job
+
+    def _free(self, job: ScratchDir):
+        with self._cond:
+            if job.ram:
+                self._ram_reserved -= job.reserved
+            else:
+                self._reserved -= job.reserved
+            self._jobs -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"jobs": self._jobs, "waiting": self._waiting, "reserved": self._reserved,
+                    "ram_reserved": self._ram_reserved}
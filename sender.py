@@ -0,0 +1,55 @@
+import logging
+from typing import Optional, Tuple
+
+import telebot
+from telebot.apihelper import ApiTelegramException
+from telebot.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Telegram downloads files given by URL itself, up to these sizes
+URL_SIZE_LIMITS = {
+    "photo": 5 * 1024 * 1024,
+    "video": 20 * 1024 * 1024,
+    "gif": 20 * 1024 * 1024,
+}
+
+
+def fits_url_upload(media_type: str, size: Optional[int]) -> bool:
+    """Whether Telegram can fetch the file itself. Unknown sizes are worth a try, Telegram says no if too big."""
+    limit = URL_SIZE_LIMITS.get(media_type)
+    return limit is not None and (size is None or size <= limit)
+
+
+def send_by_url(bot: telebot.TeleBot, media_type: str, chat_id, url: str, size: Optional[int] = None,
+                **kwargs) -> Optional[Message]:
+    """Lets Telegram fetch url, so the file never touches our bandwidth or disk.
+
+    Returns None when the file isn't eligible or Telegram couldn't fetch it, the caller uploads it then.
+    """
+    if not fits_url_upload(media_type, size):
+        return None
+
+    send = {"photo": bot.send_photo, "video": bot.send_video, "gif": bot.send_document}[media_type]
+    try:
+        return send(chat_id, url, **kwargs)
+    except ApiTelegramException as e:
+        logger.info(f"Telegram couldn't fetch {url}, uploading it ourselves: {e.description}")
+        return None
+
+
+def sent_media(msg: Message, media_type: str) -> Tuple[str, str]:
+    """(media_type, file_id) of what Telegram made of a file sent as media_type.
+
+    Videos it can't play (e.g. not H.264) come back as documents, they're cached as "gif", which is sent as a
+    document too.
+    """
+    if media_type == "photo":
+        return "photo", msg.photo[-1].file_id
+    if media_type == "video" and msg.video is not None:
+        return "video", msg.video.file_id
+    return "gif", (msg.document or msg.animation).file_id
+
+
+def file_id_of(msg: Message, media_type: str) -> str:
+    return sent_media(msg, media_type)[1]
@@ -0,0 +1,41 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Makes sure only one download per key is in flight, later requests wait for its result."""
+
+    def __init__(self):
+        self._waiters: Dict[Hashable, List[Callable[[Any], None]]] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable, waiter: Callable[[Any], None]) -> bool:
+        """Returns True if the caller is the leader and has to do the work.
+
+        Otherwise the waiter is called with the leader's result once finish() is called for the key.
+        """
+        with self._lock:
+            if key in self._waiters:
+                self._waiters[key].append(waiter)
+                return False
+
+            self._waiters[key] = []
+            return True
+
+    def finish(self, key: Hashable, result: Any = None):
+        """Called by the leader when done, hands the result to every waiter."""
+        with self._lock:
+            waiters = self._waiters.pop(key, [])
+
+        for waiter in waiters:
+            try:
+                waiter(result)
+            except Exception as e:
+                logger.error(f"Single-flight waiter for {key} failed: {e}")
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._waiters
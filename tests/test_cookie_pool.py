@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from cookie_pool import CookiePool
+
+COOKIE_FILE = """# Netscape HTTP Cookie File
+.instagram.com\tTRUE\t/\tTRUE\t2000000000\tsessionid\t{value}
+"""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for name in ["a", "b", "c"]:
+            with open(os.path.join(self.tmpdir.name, f"{name}.txt"), "w") as f:
+                f.write(COOKIE_FILE.format(value=name))
+
+        self.clock = FakeClock()
+        self.dead = set()
+        self.checked = threading.Event()
+
+        def checker(jar):
+            value = next(iter(jar)).value
+            self.checked.set()
+            return value not in self.dead
+
+        self.pool = CookiePool(self.tmpdir.name, cooldown=60, checker=checker, clock=self.clock)
+
+    def tearDown(self):
+        self.pool.stop()
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, f"{name}.txt")
+
+    def test_rested_cookies_are_preferred(self):
+        used = [self.pool.acquire() for _ in range(3)]
+        self.assertEqual(len(set(used)), 3)
+
+        # All three are resting, the least recently used one comes back
+        self.clock.now += 1
+        self.assertEqual(self.pool.acquire(), used[0])
+
+    def test_failed_cookie_leaves_rotation(self):
+        self.dead.add("a")
+        self.pool.acquire()
+        self.pool.report(self.path("a"), False)
+
+        deadline = time.time() + 5
+        while self.pool.stats()["alive"] != 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.clock.now += 120
+        for _ in range(10):
+            self.assertNotEqual(self.pool.acquire(), self.path("a"))
+            self.clock.now += 120
+
+    def test_healthier_cookie_wins(self):
+        self.pool.load()
+        # "a" failed a download but the session is still alive: back in rotation with a lower score
+        self.pool.report(self.path("a"), False)
+        self.pool.report(self.path("b"), False)
+        self.pool.report(self.path("b"), False)
+
+        deadline = time.time() + 5
+        while self.pool.stats()["alive"] != 3 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.pool.acquire(), self.path("c"))
+        self.assertEqual(self.pool.acquire(), self.path("a"))
+        self.assertEqual(self.pool.acquire(), self.path("b"))
+
+    def test_check_all(self):
+        self.dead.add("c")
+        results = self.pool.check_all()
+
+        self.assertEqual(results, {self.path("a"): True, self.path("b"): True, self.path("c"): False})
+        self.assertEqual(self.pool.stats(), {"total": 3, "alive": 2})
+
+    def test_cookies_are_parsed_once(self):
+        self.pool.acquire()
+        self.assertEqual(self.pool.cookies_of(self.path("a")), {"sessionid": "a"})
+
+        os.remove(self.path("a"))
+        # Still served from memory until the next rescan
+        self.assertEqual(self.pool.cookies_of(self.path("a")), {"sessionid": "a"})
+        self.pool.load()
+        self.assertEqual(self.pool.cookies_of(self.path("a")), {})
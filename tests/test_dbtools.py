@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import botTools
+import dbtools
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.old_path = dbtools.DB_PATH
+        dbtools.set_db_path(os.path.join(self.tmpdir.name, "video_ids.db"))
+        dbtools.prepare_db()
+
+    def tearDown(self):
+        dbtools.set_db_path(self.old_path)
+        self.tmpdir.cleanup()
+
+    def test_wal_mode(self):
+        mode = dbtools.get_connection().execute("PRAGMA journal_mode;").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_connection_is_reused_per_thread(self):
+        self.assertIs(dbtools.get_connection(), dbtools.get_connection())
+
+        other = []
+        t = threading.Thread(target=lambda: other.append(dbtools.get_connection()))
+        t.start()
+        t.join()
+        self.assertIsNot(other[0], dbtools.get_connection())
+
+    def test_close_connections_reconnects_every_thread(self):
+        dbtools.add_photo("file1", "abc", "instagram")
+        ready, closed, done = threading.Event(), threading.Event(), threading.Event()
+        results = []
+
+        def worker():
+            dbtools.get_connection()
+            ready.set()
+            closed.wait(2)
+            try:
+                results.append(dbtools.get_connection().execute("SELECT COUNT(*) FROM videos;").fetchone()[0])
+            except Exception as e:
+                results.append(e)
+            done.set()
+
+        threading.Thread(target=worker).start()
+        ready.wait(2)
+        dbtools.close_connections()
+        closed.set()
+        done.wait(2)
+        self.assertEqual(results, [1])
+
+    def test_add_album_is_cached_whole(self):
+        dbtools.get_cached_post("abc", "reddit")  # Cached miss, must not hide the album
+
+        with mock.patch.object(dbtools, "_load_post", wraps=dbtools._load_post) as load:
+            dbtools.add_album([("a", "photo"), ("b", "video"), ("c", "gif")], "abc", "reddit", "hi")
+        load.assert_called_once()
+
+        post = dbtools.get_cached_post("abc", "reddit")
+        self.assertEqual([(m.file_id, m.media_type) for m in post.media],
+                         [("a", "photo"), ("b", "video"), ("c", "gif")])
+        self.assertEqual(post.description, "hi")
+
+    def test_add_and_read_media(self):
+        dbtools.add_photo("file1", "abc", "instagram")
+        dbtools.add_video("file2", "abc", "instagram")
+        dbtools.add_description('quotes " and \' are fine', "abc", "instagram")
+
+        dbtools.add_sound("file3", "abc", "instagram")
+
+        post = dbtools.get_cached_post("abc", "instagram")
+        self.assertEqual(post.media, (dbtools.CachedMedia("file1", "photo"), dbtools.CachedMedia("file2", "video")))
+        self.assertEqual(post.description, 'quotes " and \' are fine')
+        self.assertEqual(post.audio_file_id, "file3")
+
+    def test_inserts_populate_memory_cache(self):
+        dbtools.add_photo("file1", "abc", "instagram")
+        misses = dbtools.cache_stats()["misses"]
+
+        self.assertEqual(len(dbtools.get_cached_post("abc", "instagram").media), 1)
+
+        # An insert replaces the cached entry instead of leaving a stale one behind
+        dbtools.add_photo("file2", "abc", "instagram")
+        dbtools.add_description("hi", "abc", "instagram")
+        post = dbtools.get_cached_post("abc", "instagram")
+        self.assertEqual(len(post.media), 2)
+        self.assertEqual(post.description, "hi")
+        self.assertEqual(dbtools.cache_stats()["misses"], misses)
+
+    def test_miss_does_not_cache_a_snapshot_older_than_a_write(self):
+        dbtools.add_video("file1", "abc", "youtube")
+        dbtools._post_cache.clear()
+        load_post = dbtools._load_post
+
+        def load_then_write(platform_id, platform):
+            post = load_post(platform_id, platform)
+            if post.audio_file_id is None:  # The reader's load, the sound is committed before it's cached
+                dbtools.add_sound("sound1", "abc", "youtube")
+            return post
+
+        with mock.patch.object(dbtools, "_load_post", side_effect=load_then_write):
+            self.assertIsNone(dbtools.get_cached_post("abc", "youtube").audio_file_id)
+
+        self.assertEqual(dbtools.get_cached_post("abc", "youtube").audio_file_id, "sound1")
+        self.assertEqual(dbtools._loads, {})
+
+    def test_cache_miss(self):
+        self.assertIsNone(dbtools.get_cached_post("nope", "instagram"))
+
+    def test_post_without_description(self):
+        dbtools.add_video("file1", "abc", "youtube")
+
+        post = dbtools.get_cached_post("abc", "youtube")
+        self.assertIsNone(post.description)
+        self.assertIsNone(post.audio_file_id)
+
+    def test_failed_insert_rolls_back(self):
+        dbtools.add_video("file1", "abc", "youtube")
+        with self.assertRaises(sqlite3.IntegrityError):
+            dbtools.add_video("file1", "abc", "youtube")
+
+        self.assertFalse(dbtools.get_connection().in_transaction)
+        self.assertEqual(len(dbtools.get_cached_post("abc", "youtube").media), 1)
+
+    def test_same_id_on_different_platforms(self):
+        dbtools.add_video("file1", "abc", "youtube")
+        dbtools.add_photo("file2", "abc", "tiktok")
+        dbtools.add_description("yt", "abc", "youtube")
+        dbtools.add_description("tt", "abc", "tiktok")
+
+        self.assertEqual(dbtools.get_cached_post("abc", "tiktok").media, (dbtools.CachedMedia("file2", "photo"),))
+        self.assertEqual(dbtools.get_cached_post("abc", "youtube").description, "yt")
+
+    def test_album_order_is_kept(self):
+        ids = ["z", "a", "m", "b"]
+        for file_id in ids:
+            dbtools.add_photo(file_id, "abc", "instagram")
+
+        self.assertEqual([m.file_id for m in dbtools.get_cached_post("abc", "instagram").media], ids)
+
+    def test_lookup_uses_index(self):
+        plan = dbtools.get_connection().execute("""
+            EXPLAIN QUERY PLAN
+            SELECT file_id, media_type FROM videos WHERE platform = ? AND platform_id = ? ORDER BY position;""",
+                                                ("instagram", "abc")).fetchall()
+        self.assertIn("COVERING INDEX idx_videos_lookup", " ".join(row[-1] for row in plan))
+
+    def test_migrates_legacy_db(self):
+        path = os.path.join(self.tmpdir.name, "legacy.db")
+        legacy = sqlite3.connect(path)
+        legacy.execute("""CREATE TABLE videos (file_id VARCHAR(255), platform_id VARCHAR(255),
+                          platform VARCHAR(255), media_type VARCHAR(255),
+                          PRIMARY KEY(file_id, platform_id, platform));""")
+        legacy.execute("""CREATE TABLE descriptions (description TEXT(255), platform_id VARCHAR(255) PRIMARY KEY,
+                          platform VARCHAR(255));""")
+        legacy.executemany("INSERT INTO videos VALUES (?, ?, ?, ?);",
+                           [("z", "abc", "instagram", "photo"), ("a", "abc", "instagram", "video"),
+                            ("y", "xyz", "youtube", "video")])
+        legacy.execute("INSERT INTO descriptions VALUES ('hi', 'abc', 'instagram');")
+        legacy.commit()
+        legacy.close()
+
+        dbtools.set_db_path(path)
+        dbtools.prepare_db()
+        dbtools.prepare_db()  # Running it again is a no-op
+
+        self.assertEqual(dbtools.get_schema_version(), len(dbtools.MIGRATIONS))
+        post = dbtools.get_cached_post("abc", "instagram")
+        self.assertEqual([m.file_id for m in post.media], ["z", "a"])
+        self.assertEqual(post.description, "hi")
+        self.assertEqual(dbtools.get_cached_post("xyz", "youtube").media[0].file_id, "y")
+
+        dbtools.add_photo("b", "abc", "instagram")
+        self.assertEqual([m.file_id for m in dbtools.get_cached_post("abc", "instagram").media], ["z", "a", "b"])
+
+    def test_assets_are_uploaded_once_per_bot(self):
+        path = os.path.join(self.tmpdir.name, "cube.png")
+        with open(path, "wb") as f:
+            f.write(b"not really a png")
+
+        bot = mock.Mock(token="123:abc")
+        bot.send_photo.return_value.photo = [mock.Mock(file_id="small"), mock.Mock(file_id="big")]
+
+        self.assertEqual(botTools.get_photo_file_id(bot, path, "-100"), "big")
+        self.assertEqual(botTools.get_photo_file_id(bot, path, "-100"), "big")
+        bot.send_photo.assert_called_once()
+        upload = bot.send_photo.call_args[0][1]
+        self.assertEqual((upload.name, upload.getvalue()), ("cube.png", b"not really a png"))
+
+        other_bot = mock.Mock(token="456:def")
+        other_bot.send_photo.return_value.photo = [mock.Mock(file_id="other")]
+        self.assertEqual(botTools.get_photo_file_id(other_bot, path, "-100"), "other")
@@ -0,0 +1,120 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from gallery_dl import config
+
+import gallery_engine
+
+BASE = {
+    "extractor": {
+        "base-directory": "media-downloads",
+        "danbooru": {"postprocessors": ["metadata"]},
+    },
+}
+
+
+class Test(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(gallery_engine, "_base_config", BASE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def make_job(self, post_id: str):
+        conf = gallery_engine.job_config({
+            ("extractor",): {"directory": ["danbooru", post_id], "cookies": f"{post_id}.txt"},
+            ("postprocessor", "metadata"): {"filename": post_id + ".txt"},
+        })
+        return gallery_engine.IsolatedDownloadJob(f"https://danbooru.donmai.us/posts/{post_id}", conf=conf)
+
+    def test_jobs_do_not_share_config(self):
+        first = self.make_job("1")
+        second = self.make_job("2")
+
+        self.assertEqual(first.extractor.config("directory"), ["danbooru", "1"])
+        self.assertEqual(second.extractor.config("directory"), ["danbooru", "2"])
+        self.assertEqual(second.extractor.config("cookies"), "2.txt")
+        self.assertEqual(first.extractor.config("base-directory"), "media-downloads")
+
+        # Nothing leaks into gallery-dl's process-wide config or the shared base
+        self.assertIsNone(config.get(("extractor",), "directory"))
+        self.assertNotIn("directory", BASE["extractor"])
+
+    def test_named_postprocessors_come_from_job_config(self):
+        job = self.make_job("3")
+        self.assertEqual(job.extractor.config_accumulate("postprocessors"), [{"filename": "3.txt"}])
+
+    def test_base_config_is_parsed_once(self):
+        with mock.patch.object(gallery_engine, "_base_config", None), \
+                mock.patch.object(gallery_engine.config, "load") as load:
+            gallery_engine.base_config()
+            gallery_engine.base_config()
+            gallery_engine.job_config({})
+
+        self.assertEqual(load.call_count, 1)
+
+    def test_oversized_file_aborts_the_job(self):
+        job = self.make_job("4")
+        job.max_filesize = job.root.max_filesize = 1000
+        job.pathfmt = mock.Mock(temppath="", realpath=os.path.join(self.tmpdir.name, "big.mp4"))
+
+        # The HTTP downloader reports success but writes nothing when filesize-max is exceeded
+        with mock.patch.object(gallery_engine.job.DownloadJob, "download", return_value=True):
+            with self.assertRaises(gallery_engine.exception.StopExtraction):
+                job.download("https://example.com/big.mp4")
+        self.assertTrue(job.oversized)
+
+        job.extractor.initialize()
+        http = job.get_downloader("https")
+        self.assertEqual(http.maxsize, 1000)
+
+    def test_existing_file_is_not_oversized(self):
+        job = self.make_job("5")
+        job.max_filesize = job.root.max_filesize = 1000
+        path = os.path.join(self.tmpdir.name, "5_1.jpg")
+        open(path, "wb").close()
+        job.pathfmt = mock.Mock(temppath="", realpath=path)
+
+        # Files already on disk are skipped with the same empty temppath
+        with mock.patch.object(gallery_engine.job.DownloadJob, "download", return_value=True):
+            self.assertTrue(job.download("https://example.com/5_1.jpg"))
+        self.assertFalse(job.oversized)
+
+    def test_total_size_is_capped_across_files(self):
+        job = self.make_job("6")
+        job.max_filesize = job.root.max_filesize = 1000
+        job.max_total = job.root.max_total = 1500
+        path = os.path.join(self.tmpdir.name, "6_1.jpg")
+        with open(path, "wb") as f:
+            f.write(b"x" * 800)
+        job.pathfmt = mock.Mock(temppath=path, realpath=path)
+
+        with mock.patch.object(gallery_engine.job.DownloadJob, "download", return_value=True):
+            job.download("https://example.com/6_1.jpg")
+            job.extractor.initialize()
+            self.assertEqual(job.get_downloader("https").maxsize, 700)  # What's left of the total
+
+            with self.assertRaises(gallery_engine.exception.StopExtraction):
+                job.download("https://example.com/6_2.jpg")
+        self.assertTrue(job.over_quota)
+        self.assertFalse(job.oversized)  # Every file fit on its own
+
+    def test_file_skipped_under_the_remaining_total_is_over_quota(self):
+        job = self.make_job("7")
+        job.max_filesize = job.root.max_filesize = 1000
+        job.max_total = job.root.max_total = 1500
+        job.root.written = 800
+        job.pathfmt = mock.Mock(temppath="", realpath=os.path.join(self.tmpdir.name, "7_2.jpg"))
+
+        with mock.patch.object(gallery_engine.job.DownloadJob, "download", return_value=True):
+            with self.assertRaises(gallery_engine.exception.StopExtraction):
+                job.download("https://example.com/7_2.jpg")
+        self.assertTrue(job.over_quota)
+        self.assertFalse(job.oversized)
+
+    def test_missing_internals_fail_loudly(self):
+        with mock.patch.object(gallery_engine, "_REQUIRED_INTERNALS", [(config, "_no_such_attribute")]):
+            with self.assertRaisesRegex(ImportError, "_no_such_attribute"):
+                gallery_engine._check_internals()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import exceptions
+import httpclient
+
+PAYLOAD = os.urandom(1024 * 1024)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        if self.path == "/ranged" and range_header:
+            start, end = map(int, range_header.split("=")[1].split("-"))
+            part = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{start + len(part) - 1}/{len(PAYLOAD)}")
+            self.send_header("Content-Length", str(len(part)))
+            self.end_headers()
+            self.wfile.write(part)
+            return
+
+        self.send_response(200)
+        if self.path == "/sized":
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+class Test(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "file.bin")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_streams_whole_file(self):
+        written = httpclient.stream_to_file(self.base + "/sized", self.path, max_bytes=len(PAYLOAD))
+        self.assertEqual(written, len(PAYLOAD))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+    def test_content_length_over_limit_fails_before_writing(self):
+        with self.assertRaises(exceptions.FileTooBigException):
+            httpclient.stream_to_file(self.base + "/sized", self.path, max_bytes=1000)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_aborts_while_streaming_and_removes_partial_file(self):
+        # No Content-Length, the limit can only be enforced as the bytes arrive
+        with self.assertRaises(exceptions.FileTooBigException):
+            httpclient.stream_to_file(self.base + "/unsized", self.path, max_bytes=len(PAYLOAD) // 2)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_range_total_over_limit_fails_before_writing(self):
+        with self.assertRaises(exceptions.FileTooBigException):
+            httpclient.stream_to_file(self.base + "/ranged", self.path, max_bytes=1000, ranged=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_ranged_download_under_limit_is_complete(self):
+        written = httpclient.stream_to_file(self.base + "/ranged", self.path, max_bytes=len(PAYLOAD), ranged=True)
+        self.assertEqual(written, len(PAYLOAD))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+    def test_ranged_without_server_support_still_streams(self):
+        written = httpclient.stream_to_file(self.base + "/unsized", self.path, max_bytes=len(PAYLOAD), ranged=True)
+        self.assertEqual(written, len(PAYLOAD))
+
+    def test_budget_caps_files_together(self):
+        budget = httpclient.ByteBudget(len(PAYLOAD) * 3 // 2)
+        httpclient.stream_to_file(self.base + "/unsized", self.path, budget=budget)
+
+        second = os.path.join(self.tmpdir.name, "second.bin")
+        with self.assertRaises(exceptions.ScratchQuotaException):
+            httpclient.stream_to_file(self.base + "/unsized", second, budget=budget)
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(budget.used, len(PAYLOAD))  # The removed file's bytes are given back
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from lrucache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+        cache.put("a", 1)
+
+        clock.now = 4
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 6
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_counters(self):
+        cache = LRUCache(maxsize=10)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        cache.invalidate("a")
+        cache.get("a")
+
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 2, "size": 0})
@@ -0,0 +1,197 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# main runs its setup on import, so every scenario gets its own interpreter and directory. The scenario runs after
+# this prelude and prints a JSON line with its results
+PRELUDE = """
+import itertools, json, threading
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import telebot
+
+class FakeBot:
+    def __init__(self, token, *args, **kwargs):
+        self.replies = []
+        self.reactions = []
+        self.blocked_chat = None  # Sends to it wait for unblock, like a chat that is out of tokens
+        self.blocking = threading.Event()
+        self.unblock = threading.Event()
+        self._ids = itertools.count(1)
+        self.changed = threading.Condition()
+
+    def message_handler(self, *args, **kwargs):
+        return lambda fn: fn
+
+    callback_query_handler = message_handler
+
+    def register_message_handler(self, *args, **kwargs):
+        pass
+
+    def _send(self, chat_id, media=None, *args, reply_to_message_id=None, **kwargs):
+        if chat_id == self.blocked_chat:
+            self.blocking.set()
+            self.unblock.wait(10)
+        item = SimpleNamespace(file_id=media if isinstance(media, str) else f"file{next(self._ids)}")
+        with self.changed:
+            if chat_id == 1000:
+                self.replies.append(item.file_id)
+            self.changed.notify_all()
+        return SimpleNamespace(message_id=next(self._ids), photo=[item], video=item, document=item, audio=item)
+
+    send_photo = send_video = send_document = send_audio = send_message = _send
+
+    def send_media_group(self, chat_id, media=None, **kwargs):
+        return [self._send(chat_id, item.media, **kwargs) for item in media]
+
+    def set_message_reaction(self, chat_id, message_id, reaction):
+        with self.changed:
+            self.reactions.append(reaction[0].emoji)
+            self.changed.notify_all()
+
+    def delete_message(self, *args, **kwargs):
+        pass
+
+with mock.patch.object(telebot, "TeleBot", FakeBot):
+    import main
+
+import dbtools
+import toolbox as util
+
+bot = main.bot
+
+def new_message(message_id, chat_id, text):
+    return SimpleNamespace(id=message_id, message_id=message_id, chat=SimpleNamespace(id=chat_id, type="private"),
+                           text=text)
+"""
+
+INDEPENDENT_LINKS = """
+release = threading.Event()
+
+def fake_download(parsed, folder, max_total=None):
+    if parsed.platform == "twitter":
+        raise RuntimeError("gallery-dl broke")
+    release.wait(10)  # A slow download, still running while the cached link is answered
+    Path(folder, parsed.post_id + "_1.jpg").write_bytes(b"jpg")
+
+dbtools.add_photo("cached", "111", "twitter")
+message = new_message(7, 1000, "https://www.reddit.com/r/pics/comments/abcdef/title/ https://x.com/a/status/222 "
+                               "https://x.com/a/status/111")
+
+with mock.patch.object(util, "download_media", fake_download):
+    main.echo_all(message)
+    with bot.changed:
+        cached_first = bot.changed.wait_for(lambda: "cached" in bot.replies, 5)
+        before_release = list(bot.reactions)
+    release.set()
+    with bot.changed:
+        bot.changed.wait_for(lambda: len(bot.replies) >= 2 and len(bot.reactions) >= 2, 10)
+    main.download_scheduler.shutdown(wait=True)
+    main.reply_scheduler.shutdown(wait=True)
+
+print(json.dumps({"cached_first": cached_first, "before_release": before_release, "replies": bot.replies,
+                  "reactions": bot.reactions}))
+"""
+
+THROTTLED_WAITER = """
+go = threading.Event()
+started = []
+
+def fake_download(parsed, folder, max_total=None):
+    started.append(parsed.post_id)
+    go.wait(10)
+    Path(folder, parsed.post_id + "_1.jpg").write_bytes(b"jpg")
+
+bot.blocked_chat = 2000
+with mock.patch.object(util, "download_media", fake_download):
+    main.echo_all(new_message(1, 1000, "https://www.reddit.com/r/pics/comments/aaaaaa/title/"))
+    main.echo_all(new_message(2, 2000, "https://www.reddit.com/r/pics/comments/aaaaaa/title/"))  # Waits on the first
+    go.set()
+    waiter_blocked = bot.blocking.wait(5)
+
+    # reddit is limited to one download at a time, the next one only starts if the leader's slot is free
+    main.echo_all(new_message(3, 1000, "https://www.reddit.com/r/pics/comments/bbbbbb/title/"))
+    with bot.changed:
+        next_started = bot.changed.wait_for(lambda: len(bot.replies) >= 2, 5)
+
+    bot.unblock.set()
+    main.download_scheduler.shutdown(wait=True)
+    main.reply_scheduler.shutdown(wait=True)
+
+print(json.dumps({"waiter_blocked": waiter_blocked, "next_started": next_started, "started": started}))
+"""
+
+DIRECT_AS_DOCUMENT = """
+import httpclient
+
+def send_video(chat_id, video=None, *args, **kwargs):
+    bot._send(chat_id, video, **kwargs)
+    return SimpleNamespace(video=None, document=SimpleNamespace(file_id="doc"), animation=None)
+
+url = "https://example.com/clip.mp4"
+with mock.patch.object(httpclient, "remote_size", return_value=1024), mock.patch.object(bot, "send_video", send_video):
+    main.echo_all(new_message(1, 1000, url))
+    main.download_scheduler.shutdown(wait=True)
+
+post = dbtools.get_cached_post(util.direct_url_id(url), "direct")
+print(json.dumps({"reactions": bot.reactions, "media": [list(m) for m in post.media]}))
+"""
+
+BOOT_LOGGING = """
+import sys
+
+main.log_versions()
+print(json.dumps({"yt_dlp": "yt_dlp" in sys.modules}))
+"""
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="torodl-test-")
+        shutil.copytree(ROOT / "img", Path(self.workdir, "img"))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def run_scenario(self, scenario: str, **env) -> dict:
+        env = dict(os.environ, PYTHONPATH=str(ROOT), BOT_TOKEN="123:fake", PRIVATE_CHANNEL_ID="-100",
+                   ADMIN_USER_ID="1", METRICS_PORT="0", KEEP_VIDEO_AUDIO="false", **env)
+        result = subprocess.run([sys.executable, "-c", PRELUDE + scenario], cwd=self.workdir, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_links_of_a_message_are_answered_independently(self):
+        result = self.run_scenario(INDEPENDENT_LINKS)
+
+        # The cache hit didn't wait for the download queued before it
+        self.assertTrue(result["cached_first"])
+        self.assertNotIn("👌", result["before_release"])
+        # The failing link didn't stop the slow one, and the message shows the failure once everything is done
+        self.assertEqual(len(result["replies"]), 2)
+        self.assertEqual(result["reactions"], ["👀", "😢"])
+
+    def test_throttled_waiter_does_not_hold_the_download_slot(self):
+        result = self.run_scenario(THROTTLED_WAITER, PLATFORM_LIMITS="reddit=1")
+
+        self.assertTrue(result["waiter_blocked"])
+        self.assertTrue(result["next_started"])
+        self.assertEqual(result["started"], ["aaaaaa", "bbbbbb"])
+
+    def test_boot_logging_does_not_import_yt_dlp(self):
+        self.assertFalse(self.run_scenario(BOOT_LOGGING)["yt_dlp"])
+
+    def test_direct_video_kept_as_document_is_served(self):
+        result = self.run_scenario(DIRECT_AS_DOCUMENT)
+
+        self.assertEqual(result["reactions"], ["👀", "👌"])
+        self.assertEqual(result["media"], [["doc", "gif"]])
@@ -0,0 +1,62 @@
+import urllib.request
+from unittest import TestCase, mock
+
+import metrics
+
+
+class Test(TestCase):
+    def register(self, metric):
+        """Keeps the test's metrics out of the shared registry once it's done."""
+        self.addCleanup(metrics.unregister, metric)
+        return metric
+
+    def test_timed_records_latency_and_failures(self):
+        stage_seconds = self.register(metrics.Histogram("test_stage_seconds", "Test.", ("stage", "platform")))
+        failures = self.register(metrics.Counter("test_failures_total", "Test.", ("stage", "platform", "type")))
+        patcher = mock.patch.multiple(metrics, STAGE_SECONDS=stage_seconds, FAILURES=failures)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with metrics.timed("download", "test-ok"):
+            pass
+
+        with self.assertRaises(ValueError):
+            with metrics.timed("download", "test-fail"):
+                raise ValueError()
+
+        self.assertEqual(metrics.STAGE_SECONDS.count("download", "test-ok"), 1)
+        self.assertEqual(metrics.STAGE_SECONDS.count("download", "test-fail"), 1)
+        self.assertEqual(metrics.FAILURES.value("download", "test-fail", "ValueError"), 1)
+        self.assertEqual(metrics.FAILURES.value("download", "test-ok", "ValueError"), 0)
+
+    def test_text_format(self):
+        histogram = self.register(metrics.Histogram("test_seconds", "Test.", ("stage",), buckets=(1, 5)))
+        histogram.observe(0.5, "a")
+        histogram.observe(3, "a")
+        self.register(metrics.Callback("test_cache", "Test.", lambda: {("hit",): 3, ("miss",): 1}, "counter",
+                                       ("result",)))
+
+        text = metrics.render()
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{stage="a",le="1"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="a",le="5"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 2', text)
+        self.assertIn('test_seconds_sum{stage="a"} 3.5', text)
+        self.assertIn('test_cache{result="hit"} 3', text)
+
+    def test_endpoint(self):
+        server = metrics.start_server(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5) as response:
+            self.assertIn("torodl_stage_seconds", response.read().decode())
+
+    def test_unregister(self):
+        counter = metrics.Counter("test_gone_total", "Test.")
+        metrics.unregister(counter)
+        self.assertNotIn("test_gone_total", metrics.render())
+
+    def test_metric_needs_samples(self):
+        with self.assertRaises(TypeError):
+            metrics._Metric("test_abstract", "Test.")
@@ -0,0 +1,93 @@
+import io
+import threading
+import time
+from unittest import TestCase, mock
+
+import ratelimit
+from ratelimit import RateLimiter, TokenBucket
+
+URL = "https://api.telegram.org/bot123:abc/"
+
+
+def response(status: int, retry_after: float = 0):
+    resp = mock.Mock(status_code=status)
+    resp.json.return_value = {"ok": status == 200, "parameters": {"retry_after": retry_after}}
+    return resp
+
+
+class Test(TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, capacity=2, now=0)
+        bucket.take(0)
+        bucket.take(0)
+        self.assertAlmostEqual(bucket.delay(0), 0.5)
+        self.assertEqual(bucket.delay(0.5), 0)
+
+        bucket.block(until=10)
+        self.assertAlmostEqual(bucket.delay(4), 6)
+        self.assertEqual(bucket.delay(10), 0)
+        bucket.take(10)
+        self.assertAlmostEqual(bucket.delay(10), 0.5)  # No burst right after a block
+
+    def test_retries_429_and_rewinds_files(self):
+        request = mock.Mock(side_effect=[response(429, 0.01), response(200)])
+        limiter = RateLimiter(request=request)
+        upload = io.BytesIO(b"video")
+        upload.read()
+
+        result = limiter.send("post", URL + "sendVideo", params={"chat_id": 5}, files={"video": ("a.mp4", upload)})
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(upload.tell(), 0)
+        self.assertEqual(limiter.stats(), {"sent": 2, "throttled": 1, "retried": 1})
+
+    def test_gives_up_after_max_retries(self):
+        request = mock.Mock(return_value=response(429, 0))
+        limiter = RateLimiter(request=request, max_retries=2)
+        self.assertEqual(limiter.send("post", URL + "sendMessage", params={"chat_id": 5}).status_code, 429)
+        self.assertEqual(request.call_count, 3)
+
+    def test_per_chat_limit(self):
+        limiter = RateLimiter(request=mock.Mock(return_value=response(200)), chat_rates={"7": (20, 1)})
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.send("post", URL + "sendMessage", params={"chat_id": 7})
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        # Other chats aren't held back by chat 7
+        self.assertFalse(limiter.acquire("8"))
+
+    def test_replies_go_before_admin_notices(self):
+        limiter = RateLimiter(admin_chat_id="1", global_rate=(20, 1), request=mock.Mock())
+        limiter.acquire(None)  # Empties the global bucket
+        order = []
+
+        def send(chat_id):
+            limiter.acquire(chat_id, limiter.classify("sendMessage", chat_id))
+            order.append(chat_id)
+
+        admin = threading.Thread(target=send, args=("1",))
+        admin.start()
+        time.sleep(0.01)
+        user = threading.Thread(target=send, args=("2",))
+        user.start()
+        admin.join()
+        user.join()
+
+        self.assertEqual(order, ["2", "1"])
+
+    def test_install(self):
+        limiter = RateLimiter()
+        with mock.patch.object(ratelimit.apihelper, "CUSTOM_REQUEST_SENDER", None):
+            ratelimit.install(limiter)
+            self.assertEqual(ratelimit.apihelper.CUSTOM_REQUEST_SENDER, limiter.send)
+
+    def test_reactions_have_their_own_allowance(self):
+        limiter = RateLimiter(request=mock.Mock(return_value=response(200)), chat_rates={"7": (0.01, 1)})
+        limiter.send("post", URL + "sendMessage", params={"chat_id": 7})  # Chat 7 is out of message tokens
+
+        start = time.monotonic()
+        limiter.send("post", URL + "setMessageReaction", params={"chat_id": 7})
+        limiter.send("post", URL + "deleteMessage", params={"chat_id": 7})
+        self.assertLess(time.monotonic() - start, 0.05)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from reactions import MessageReactions
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.sent = []
+        self.reactions = MessageReactions(lambda chat_id, message_id, emoji: self.sent.append(emoji))
+
+    def test_worst_result_is_shown_once_all_links_are_done(self):
+        self.reactions.expect(1, 10, 3)
+        self.reactions.react(1, 10, '👀')
+        self.reactions.react(1, 10, '👌')
+        self.reactions.react(1, 10, '👀')
+        self.reactions.react(1, 10, '😢')
+        self.assertEqual(self.sent, ['👀'])
+
+        self.reactions.react(1, 10, '🤯')
+        self.assertEqual(self.sent, ['👀', '😢'])
+
+    def test_nothing_changes_after_the_result(self):
+        self.reactions.expect(1, 10, 1)
+        self.reactions.react(1, 10, '👌')
+        self.reactions.react(1, 10, '👀')  # A late one, e.g. from the reply queue
+        self.reactions.react(1, 10, '😢')
+        self.assertEqual(self.sent, ['👌'])
+
+    def test_unannounced_messages_get_every_reaction(self):
+        self.reactions.react(1, 10, '👀')
+        self.reactions.react(1, 10, '👌')
+        self.assertEqual(self.sent, ['👀', '👌'])
+
+    def test_failed_reaction_is_not_raised(self):
+        def broken(*args):
+            raise RuntimeError("boom")
+
+        MessageReactions(broken).react(1, 10, '👌')
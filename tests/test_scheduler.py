@@ -0,0 +1,59 @@
+import threading
+import time
+from unittest import TestCase
+
+from scheduler import DownloadScheduler, parse_platform_limits
+
+
+class Test(TestCase):
+    def test_parse_platform_limits(self):
+        self.assertEqual(parse_platform_limits("instagram=2, youtube=3"), {"instagram": 2, "youtube": 3})
+        self.assertEqual(parse_platform_limits(""), {})
+
+    def test_platform_limit_is_respected(self):
+        s = DownloadScheduler(workers=4, platform_limits={"instagram": 1})
+        s.start()
+
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def job():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+
+        futures = [s.submit("instagram", job) for _ in range(4)]
+        for f in futures:
+            f.result(timeout=5)
+        s.shutdown()
+
+        self.assertEqual(max(peak), 1)
+
+    def test_slow_platform_does_not_starve_others(self):
+        s = DownloadScheduler(workers=2, platform_limits={"instagram": 1})
+        s.start()
+
+        release = threading.Event()
+        slow = [s.submit("instagram", release.wait, 5) for _ in range(3)]
+        fast = s.submit("youtube", lambda: "done")
+
+        self.assertEqual(fast.result(timeout=2), "done")
+        release.set()
+        for f in slow:
+            f.result(timeout=5)
+        s.shutdown()
+
+    def test_exception_is_set_on_future(self):
+        s = DownloadScheduler(workers=1)
+        s.start()
+
+        def boom():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            s.submit("twitter", boom).result(timeout=2)
+        s.shutdown()
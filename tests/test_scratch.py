@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+import exceptions
+from scratch import ScratchSpace
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "scratch")
+        self.ram_root = os.path.join(self.tmpdir.name, "ram")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_directory_is_removed_on_every_exit(self):
+        space = ScratchSpace(self.root, 100)
+
+        with space.acquire("post", 10) as job:
+            (job.path / "a.jpg").write_bytes(b"x")
+        self.assertFalse(job.path.exists())
+
+        with self.assertRaises(ValueError):
+            with space.acquire("post", 10) as job:
+                (job.path / "a.jpg").write_bytes(b"x")
+                raise ValueError()
+        self.assertFalse(job.path.exists())
+
+        job.release()  # Again, nothing happens
+        self.assertEqual(space.stats(), {"jobs": 0, "waiting": 0, "reserved": 0, "ram_reserved": 0})
+
+    def test_jobs_wait_for_space(self):
+        space = ScratchSpace(self.root, 100)
+        first = space.acquire("first", 60)
+        admitted = threading.Event()
+
+        def second():
+            with space.acquire("second", 60):
+                admitted.set()
+
+        t = threading.Thread(target=second)
+        t.start()
+        self.assertFalse(admitted.wait(0.1))
+        self.assertEqual(space.stats()["waiting"], 1)
+
+        first.release()
+        self.assertTrue(admitted.wait(2))
+        t.join()
+
+    def test_gives_up_after_timeout(self):
+        space = ScratchSpace(self.root, 100)
+        with space.acquire("first", 100):
+            with self.assertRaises(exceptions.ScratchFullException):
+                space.acquire("second", 1, timeout=0)
+        self.assertEqual(space.stats()["waiting"], 0)
+
+    def test_ram_falls_back_to_disk(self):
+        space = ScratchSpace(self.root, 100, self.ram_root, 50)
+
+        with space.acquire("photo", 40, ram=True) as in_ram, space.acquire("photo", 40, ram=True) as on_disk:
+            self.assertTrue(in_ram.ram)
+            self.assertTrue(str(in_ram.path).startswith(self.ram_root))
+            self.assertFalse(on_disk.ram)
+            self.assertEqual(space.stats()["ram_reserved"], 40)
+            self.assertEqual(space.stats()["reserved"], 40)
+
+        self.assertFalse(ScratchSpace(self.root, 100).acquire("photo", 1, ram=True).ram)
+
+    def test_reset_only_removes_its_own_leftovers(self):
+        os.makedirs(os.path.join(self.ram_root, "torodl-post-1"))
+        os.makedirs(os.path.join(self.ram_root, "someone-else"))
+        ScratchSpace(self.root, 100, self.ram_root, 50).reset()
+        self.assertEqual(os.listdir(self.ram_root), ["someone-else"])
@@ -0,0 +1,43 @@
+from unittest import TestCase, mock
+
+from telebot.apihelper import ApiTelegramException
+
+import sender
+
+MB = 1024 * 1024
+
+
+class Test(TestCase):
+    def test_size_limits(self):
+        self.assertTrue(sender.fits_url_upload("photo", 4 * MB))
+        self.assertFalse(sender.fits_url_upload("photo", 6 * MB))
+        self.assertTrue(sender.fits_url_upload("video", 20 * MB))
+        self.assertFalse(sender.fits_url_upload("video", 21 * MB))
+        self.assertTrue(sender.fits_url_upload("video", None))
+        self.assertFalse(sender.fits_url_upload("audio", MB))
+
+    def test_send_by_url(self):
+        bot = mock.Mock()
+        resp = sender.send_by_url(bot, "video", 1, "https://example.com/a.mp4", MB, supports_streaming=True)
+
+        self.assertIs(resp, bot.send_video.return_value)
+        bot.send_video.assert_called_once_with(1, "https://example.com/a.mp4", supports_streaming=True)
+
+    def test_falls_back_when_too_big_or_rejected(self):
+        bot = mock.Mock()
+        self.assertIsNone(sender.send_by_url(bot, "video", 1, "https://example.com/a.mp4", 30 * MB))
+        bot.send_video.assert_not_called()
+
+        bot.send_photo.side_effect = ApiTelegramException(
+            "sendPhoto", mock.Mock(status_code=400),
+            {"error_code": 400, "description": "Bad Request: failed to get HTTP URL content"})
+        self.assertIsNone(sender.send_by_url(bot, "photo", 1, "https://example.com/a.jpg"))
+
+    def test_video_sent_back_as_document(self):
+        played = mock.Mock(video=mock.Mock(file_id="v"))
+        self.assertEqual(sender.sent_media(played, "video"), ("video", "v"))
+
+        # Telegram keeps videos it can't play as documents
+        kept = mock.Mock(video=None, document=mock.Mock(file_id="d"))
+        self.assertEqual(sender.sent_media(kept, "video"), ("gif", "d"))
+        self.assertEqual(sender.file_id_of(kept, "video"), "d")
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from singleflight import SingleFlight
+
+
+class Test(TestCase):
+    def test_only_first_caller_leads(self):
+        flight = SingleFlight()
+        results = []
+
+        self.assertTrue(flight.join(("youtube", "abc"), results.append))
+        self.assertFalse(flight.join(("youtube", "abc"), results.append))
+        self.assertFalse(flight.join(("youtube", "abc"), results.append))
+        self.assertTrue(flight.join(("tiktok", "abc"), results.append))
+
+        flight.finish(("youtube", "abc"), 3)
+        self.assertEqual(results, [3, 3])
+        self.assertFalse(flight.in_flight(("youtube", "abc")))
+
+        # A new request after the flight landed leads again
+        self.assertTrue(flight.join(("youtube", "abc"), results.append))
+
+    def test_failing_waiter_does_not_stop_the_others(self):
+        flight = SingleFlight()
+        results = []
+
+        def broken(_):
+            raise RuntimeError("boom")
+
+        flight.join("key", results.append)
+        flight.join("key", broken)
+        flight.join("key", results.append)
+        flight.finish("key", 1)
+
+        self.assertEqual(results, [1])
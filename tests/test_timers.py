@@ -0,0 +1,41 @@
+import threading
+from unittest import TestCase, mock
+
+import botTools
+from timers import TaskTimer
+
+
+class Test(TestCase):
+    def test_tasks_run_in_due_order(self):
+        timer = TaskTimer()
+        done = threading.Event()
+        ran = []
+
+        timer.call_later(0.05, ran.append, "late")
+        timer.call_later(0.01, ran.append, "early")
+        timer.call_later(0.08, done.set)
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(ran, ["early", "late"])
+        self.assertEqual(timer.pending(), 0)
+        timer.stop()
+
+    def test_failing_task_does_not_stop_the_timer(self):
+        timer = TaskTimer()
+        done = threading.Event()
+
+        timer.call_later(0, lambda: 1 / 0)
+        timer.call_later(0.01, done.set)
+
+        self.assertTrue(done.wait(2))
+        timer.stop()
+
+    def test_safe_delete_does_not_block(self):
+        bot = mock.Mock()
+        message = mock.Mock()
+
+        with mock.patch.object(botTools.timers, "call_later") as call_later:
+            botTools.safe_delete(bot, message, 3)
+
+        bot.delete_message.assert_not_called()
+        call_later.assert_called_once_with(3, botTools._delete, bot, message)
@@ -1,5 +1,13 @@
-from unittest import TestCase
-from toolbox import validate_url, get_platform_video_id
+import os
+import subprocess
+import sys
+from unittest import TestCase, mock
+
+import yt_dlp
+
+import toolbox
+import ytdl_engine
+from toolbox import validate_url, get_platform_video_id, get_platform, parse_url
 
 
 class Test(TestCase):
@@ -22,3 +30,100 @@ class Test(TestCase):
     def test_get_platform_video_id(self):
         for item in self.TEST_URLS:
             self.assertEqual(get_platform_video_id(item), self.TEST_URLS[item])
+
+    def test_parse_url_matches_legacy_functions(self):
+        for item in self.TEST_URLS:
+            parsed = parse_url(item)
+            self.assertEqual(parsed.post_id, self.TEST_URLS[item])
+            self.assertEqual(parsed.platform, get_platform(item))
+            self.assertEqual(parsed.url, item)
+
+    def test_parse_url_unsupported(self):
+        self.assertIsNone(parse_url('http://google.com'))
+        self.assertIsNone(parse_url('https://www.netflix.com/user/status/123'))
+        self.assertIsNone(parse_url('https://www.youtube.com/@channel'))
+        self.assertIsNone(parse_url('not a url'))
+
+    def test_parse_url_canonical(self):
+        self.assertEqual(parse_url("https://youtu.be/R4q-bxbxfXc?si=abc").canonical_url,
+                         "https://www.youtube.com/watch?v=R4q-bxbxfXc")
+        self.assertEqual(parse_url("https://x.com/lyanmyan/status/2008657476544327848?s=20").canonical_url,
+                         "https://x.com/lyanmyan/status/2008657476544327848")
+        self.assertEqual(parse_url("https://www.instagram.com/reel/DABCDEFGHIJ/?igsh=1").canonical_url,
+                         "https://www.instagram.com/reel/DABCDEFGHIJ")
+
+    def test_parse_url_kind(self):
+        self.assertEqual(parse_url("https://www.youtube.com/shorts/R4q-bxbxfXc").kind, "video")
+        self.assertEqual(parse_url("https://www.reddit.com/r/pics/comments/1abcdef/title/").kind, "gallery")
+        self.assertEqual(parse_url("https://example.com/clip.mp4?token=1").kind, "direct")
+
+    def test_parse_urls_dedupes_posts(self):
+        text = ("look https://youtu.be/R4q-bxbxfXc and https://www.youtube.com/watch?v=R4q-bxbxfXc&t=3\n"
+                "https://www.netflix.com/x https://x.com/a/status/123 https://example.com/a.mp4 "
+                "https://example.com/a.mp4 https://example.com/b.mp4")
+        self.assertEqual([(p.platform, p.url) for p in toolbox.parse_urls(text)], [
+            ("youtube", "https://youtu.be/R4q-bxbxfXc"),
+            ("twitter", "https://x.com/a/status/123"),
+            ("direct", "https://example.com/a.mp4"),
+            ("direct", "https://example.com/b.mp4"),
+        ])
+
+    def test_probe_is_reused(self):
+        ydl = mock.MagicMock()
+        ydl.__enter__.return_value = ydl
+        ydl.extract_info.return_value = {"id": "R4q-bxbxfXc", "duration": 200, "formats": []}
+        toolbox._probe_cache.clear()
+
+        engine = ytdl_engine.YtdlEngine(ytdl_engine.PROFILES)
+        with mock.patch.object(yt_dlp, "YoutubeDL", return_value=ydl), \
+                mock.patch.object(toolbox, "engine", engine):
+            url = "https://www.youtube.com/watch?v=R4q-bxbxfXc"
+            self.assertFalse(toolbox.is_video_longer_than(url, 600))
+            self.assertTrue(toolbox.is_video_longer_than("https://youtu.be/R4q-bxbxfXc", 150))
+            probe = toolbox.probe_video(url)
+
+        self.assertEqual(ydl.extract_info.call_count, 1)
+        self.assertIsNot(probe.fresh_info(), probe.info)
+        toolbox._probe_cache.clear()
+
+    def test_select_format_picks_best_that_fits(self):
+        mb = 1024 * 1024
+        probe = toolbox.VideoProbe("abc", {"duration": 100, "formats": [
+            {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a", "filesize": 2 * mb},
+            {"format_id": "137", "ext": "mp4", "vcodec": "avc1", "acodec": "none", "height": 1080, "filesize": 80 * mb},
+            {"format_id": "136", "ext": "mp4", "vcodec": "avc1", "acodec": "none", "height": 720, "tbr": 2000},
+            {"format_id": "135", "ext": "mp4", "vcodec": "avc1", "acodec": "none", "height": 480, "filesize": 10 * mb},
+            {"format_id": "248", "ext": "webm", "vcodec": "vp9", "acodec": "none", "height": 1080, "filesize": mb},
+        ]})
+
+        # 720p is estimated from its bitrate: 2000 kbit/s * 100 s = 25 MB
+        self.assertEqual(toolbox.select_format(probe), "136+140")
+        self.assertEqual(toolbox.select_format(probe, max_height=480), "135+140")
+        with self.assertRaises(toolbox.exceptions.FileTooBigException):
+            toolbox.select_format(probe, max_size=5 * mb)
+
+    def test_select_format_without_sizes_defers_to_profile(self):
+        probe = toolbox.VideoProbe("abc", {"formats": [{"format_id": "0", "ext": "mp4"}]})
+        self.assertIsNone(toolbox.select_format(probe))
+
+    def test_extract_audio_copies_track_without_reencoding(self):
+        with mock.patch.object(toolbox.subprocess, "run") as run:
+            ok = toolbox.extract_audio("a.mp4", "a_audio.m4a", {"title": "Song", "uploader": "Someone"})
+
+        self.assertTrue(ok)
+        command = run.call_args.args[0]
+        self.assertEqual(command[command.index("-c:a") + 1], "copy")
+        self.assertIn("-vn", command)
+        self.assertIn("title=Song", command)
+        self.assertIn("artist=Someone", command)
+
+    def test_extract_audio_without_ffmpeg(self):
+        with mock.patch.object(toolbox.subprocess, "run", side_effect=FileNotFoundError("ffmpeg")):
+            self.assertFalse(toolbox.extract_audio("a.mp4", "a_audio.m4a", {}))
+
+    def test_import_does_not_load_downloaders(self):
+        # Both take a while to import, startup shouldn't pay for them
+        code = "import sys, toolbox; print('yt_dlp' in sys.modules, 'gallery_dl' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.split(), ["False", "False"], result.stderr)
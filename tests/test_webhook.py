@@ -0,0 +1,47 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest import TestCase, mock
+
+import webhook
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.received = []
+        self.done = threading.Event()
+        self.bot = mock.Mock()
+
+        def process(updates):
+            self.received.extend(updates)
+            self.done.set()
+
+        self.bot.process_new_updates.side_effect = process
+        self.server = webhook.WebhookServer(self.bot, "127.0.0.1", 0, "/hook", secret_token="s3cret")
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def post(self, body: bytes, path: str = "/hook", secret: str = "s3cret") -> int:
+        request = urllib.request.Request(f"http://127.0.0.1:{self.server.port}{path}", data=body, method="POST",
+                                         headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_update_is_acked_and_dispatched(self):
+        update = {"update_id": 7, "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                                              "text": "hi"}}
+        self.assertEqual(self.post(json.dumps(update).encode()), 200)
+
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.received[0].update_id, 7)
+        self.assertEqual(self.received[0].message.text, "hi")
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.post(b"{}", secret="wrong"), 403)
+        self.assertEqual(self.post(b"{}", path="/other"), 404)
+        self.assertEqual(self.post(b"not json"), 400)
+        self.bot.process_new_updates.assert_not_called()
@@ -0,0 +1,66 @@
+import threading
+from unittest import TestCase, mock
+
+import yt_dlp
+
+import ytdl_engine
+from ytdl_engine import YtdlEngine
+
+
+class Test(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(yt_dlp, "YoutubeDL",
+                                    side_effect=lambda params: mock.MagicMock(params={"outtmpl": {}}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_instances_are_reused(self):
+        engine = YtdlEngine(ytdl_engine.PROFILES)
+
+        used = []
+        for _ in range(5):
+            with engine.checkout("probe") as ydl:
+                used.append(ydl)
+
+        self.assertTrue(all(ydl is used[0] for ydl in used))
+        self.assertEqual(engine.created, 1)
+
+    def test_profiles_have_separate_pools(self):
+        engine = YtdlEngine(ytdl_engine.PROFILES)
+
+        with engine.checkout("video", "yt-dlp-downloads/a.mp4") as video:
+            self.assertEqual(video.params["outtmpl"]["default"], "yt-dlp-downloads/a.mp4")
+        with engine.checkout("audio") as audio:
+            self.assertIsNot(audio, video)
+
+    def test_concurrent_checkouts_get_different_instances(self):
+        engine = YtdlEngine(ytdl_engine.PROFILES, max_idle=1)
+        barrier = threading.Barrier(3)
+        seen = []
+
+        def work():
+            with engine.checkout("probe") as ydl:
+                seen.append(ydl)
+                barrier.wait(timeout=5)
+
+        threads = [threading.Thread(target=work) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len({id(ydl) for ydl in seen}), 3)
+        # Only max_idle instances are kept, the rest got closed
+        closed = [ydl for ydl in seen if ydl.close.called]
+        self.assertEqual(len(closed), 2)
+
+    def test_format_override_is_per_checkout(self):
+        engine = YtdlEngine(ytdl_engine.PROFILES)
+
+        with engine.checkout("video", format_spec="136+140") as ydl:
+            ydl.build_format_selector.assert_called_once_with("136+140")
+            self.assertIs(ydl.format_selector, ydl.build_format_selector.return_value)
+
+        with engine.checkout("video") as again:
+            self.assertIs(again, ydl)
+            self.assertIsNot(again.format_selector, ydl.build_format_selector.return_value)
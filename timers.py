@@ -0,0 +1,69 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskTimer:
+    """Runs callbacks after a delay on one background thread, so waiting never holds a worker.
+
+    Pending tasks are kept in a heap ordered by due time, a thousand pending deletions cost a thousand
+    heap entries and no threads.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._heap: List[Tuple[float, int, Callable, tuple, dict]] = []
+        self._counter = itertools.count()  # Tie breaker, keeps tasks due at the same time in order
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def call_later(self, delay: float, fn: Callable, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in delay seconds."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-timer", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (self._clock() + delay, next(self._counter), fn, args, kwargs))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        wait = self._heap[0][0] - self._clock()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, fn, args, kwargs = heapq.heappop(self._heap)
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Delayed task {getattr(fn, '__name__', fn)} failed: {e}")
+
+
+timer = TaskTimer()
+
+
+def call_later(delay: float, fn: Callable, *args, **kwargs):
+    timer.call_later(delay, fn, *args, **kwargs)
@@ -1,19 +1,33 @@
 from pathlib import Path
 
+import copy
 import glob
-import http.cookiejar
+import hashlib
 import logging
 import os
 import re
 import shutil
-import urllib.request
-import yt_dlp
-from gallery_dl import config, job
-from typing import List, Any, Union
+import subprocess
+import urllib.parse
+from typing import Dict, List, Any, NamedTuple, Optional, Pattern, Union
+
+import cookie_pool
+import exceptions
+import httpclient
+from lrucache import LRUCache
+from ytdl_engine import engine
 
 logger = logging.getLogger(__name__)
 
-cindex = 0
+ig_cookies = cookie_pool.CookiePool("igcookies")
+
+# yt-dlp metadata is reused for the duration checks and the download, format URLs stay valid for hours
+PROBE_CACHE_SIZE = 128
+PROBE_CACHE_TTL = 10 * 60  # Seconds
+
+_probe_cache = LRUCache(PROBE_CACHE_SIZE, PROBE_CACHE_TTL)
+
+MAX_FILE_SIZE = 50 * 1024 * 1024  # Telegram's upload limit for bots
 
 SUPPORTED_WEBSITES = [
     "youtube.com",
@@ -36,8 +50,99 @@ DESCRIPTION_TAGS = {
 }
 
 
+class ParsedUrl(NamedTuple):
+    """A supported URL, parsed once by parse_url()."""
+    platform: str
+    post_id: Optional[str]
+    url: str  # As sent by the user
+    canonical_url: str  # Without tracking parameters and extra path segments
+    kind: str  # "video" (yt-dlp), "gallery" (gallery-dl / embeds) or "direct" (plain .mp4 file)
+
+
+class _Route(NamedTuple):
+    platform: str
+    pattern: Pattern
+    kind: str
+    canonical: Optional[str]  # Template filled with the named groups, None keeps the URL up to the end of the match
+
+
+def _route(platform: str, pattern: str, kind: str = "gallery", canonical: Optional[str] = None) -> _Route:
+    return _Route(platform, re.compile(pattern, re.IGNORECASE), kind, canonical)
+
+
+# Registered domain -> routes, every pattern is matched right after "https://" and must capture the post as "id"
+URL_ROUTES: Dict[str, List[_Route]] = {
+    "youtube.com": [
+        _route("youtube", r'(?:[\w-]+\.)*youtube\.com/(?:watch\?(?:[^#\s]*&)?v=|shorts/)(?P<id>[\w-]{11})', "video",
+               "https://www.youtube.com/watch?v={id}"),
+    ],
+    "youtu.be": [
+        _route("youtube", r'youtu\.be/(?P<id>[\w-]{11})', "video", "https://www.youtube.com/watch?v={id}"),
+    ],
+    "instagram.com": [
+        _route("instagram", r'(?:[\w-]+\.)*instagram\.com/stories/[^/]+/(?P<id>\d+)'),
+        _route("instagram", r'(?:[\w-]+\.)*instagram\.com/(?:p|reels?)/(?P<id>[\w-]{11})'),
+    ],
+    "tiktok.com": [
+        _route("tiktok", r'(?:[\w-]+\.)*tiktok\.com/@[^/]+/(?:video|photo)/(?P<id>\d{19})'),
+        _route("tiktok", r'(?:vm|vt)\.tiktok\.com/(?P<id>[\w-]{9})'),
+    ],
+    "reddit.com": [
+        _route("reddit", r'(?:[\w-]+\.)*reddit\.com/r/[^/]+/comments/(?P<id>\w+)'),
+    ],
+    "redd.it": [
+        _route("reddit", r'(?:[\w-]+\.)*redd\.it/(?P<id>\w+)'),
+    ],
+    "twitter.com": [
+        _route("twitter", r'(?:[\w-]+\.)*twitter\.com/[^/]+/status/(?P<id>\d+)'),
+    ],
+    "x.com": [
+        _route("twitter", r'(?:[\w-]+\.)*x\.com/[^/]+/status/(?P<id>\d+)'),
+    ],
+    "donmai.us": [
+        _route("danbooru", r'(?:[\w-]+\.)*donmai\.us/posts/(?P<id>\d+)'),
+    ],
+    "safebooru.org": [
+        _route("safebooru", r'(?:[\w-]+\.)*safebooru\.org/index\.php\?(?:[^#\s]*&)?id=(?P<id>\d+)', "gallery",
+               "https://safebooru.org/index.php?page=post&s=view&id={id}"),
+    ],
+}
+
+_URL_HOST = re.compile(r'https?://(?P<host>[^/?#\s:]+)', re.IGNORECASE)
+
+
+def parse_url(url: str) -> Optional[ParsedUrl]:
+    """Parses a URL in a single pass, returns None if it isn't supported.
+
+    Also works as a cheap prefilter: unsupported hosts cost one regex match and a dict lookup.
+    """
+    match = _URL_HOST.match(url)
+    if not match:
+        return None
+
+    if check_if_mp4_url(url):
+        return ParsedUrl("direct", None, url, url, "direct")
+
+    host = match.group("host").lower()
+    routes = URL_ROUTES.get(".".join(host.rsplit(".", 2)[-2:]))
+    if not routes:
+        return None
+
+    for route in routes:
+        route_match = route.pattern.match(url, match.start("host"))
+        if route_match:
+            post_id = route_match.group("id")
+            if route.canonical:
+                canonical_url = route.canonical.format(**route_match.groupdict())
+            else:
+                canonical_url = url[:route_match.end()]
+            return ParsedUrl(route.platform, post_id, url, canonical_url, route.kind)
+
+    return None
+
+
 def cleanup():
-    """Removes files left from the last time that the bot was executed."""
+    """Removes the download folders of versions from before the scratch space."""
     if os.path.exists("media-downloads"):
         shutil.rmtree("media-downloads")
 
@@ -54,18 +159,7 @@ def fix_cut_caption_string(s: str) -> str:
 
 
 def is_instagram_cookie_alive(cookie_file: str = "cookies.txt") -> bool:
-    jar = http.cookiejar.MozillaCookieJar()
-    jar.load(cookie_file, ignore_discard=True, ignore_expires=True)
-
-    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
-    opener.addheaders = [("User-Agent", "Mozilla/5.0")]
-
-    try:
-        resp = opener.open("https://www.instagram.com/accounts/edit/", timeout=10)
-        return resp.geturl() == "https://www.instagram.com/accounts/edit/"
-    except Exception as e:
-        print(getattr(e, 'code', 'No HTTP code'))
-        return False
+    return cookie_pool.is_instagram_jar_alive(cookie_pool.load_jar(cookie_file))
 
 
 def delete_dead_ig_cookies(folder_path: str = "igcookies"):
@@ -76,8 +170,9 @@ def delete_dead_ig_cookies(folder_path: str = "igcookies"):
         print(f"No .txt files found in '{folder_path}'.")
         return
 
-    for file_path in cookie_files:
-        if not is_instagram_cookie_alive(file_path):
+    # All cookies are checked at the same time, a dead one takes up to 10 seconds to time out
+    for file_path, alive in cookie_pool.check_files(cookie_files).items():
+        if not alive:
             try:
                 os.remove(file_path)
                 print(f"Deleted dead cookie file: {file_path}")
@@ -140,11 +235,34 @@ def naturally_sort_filenames(filenames: List[Union[str, Path]]) -> List[Union[st
     return sorted(filenames, key=get_natural_sort_key)
 
 
+_HTTPS_URL = re.compile(r'https://[^\s]+')
+
+
 def extract_https_url(text: str) -> str:
-    match = re.search(r'https://[^\s]+', text)
+    match = _HTTPS_URL.search(text)
     return match.group(0) if match else None
 
 
+def extract_https_urls(text: str) -> List[str]:
+    return _HTTPS_URL.findall(text)
+
+
+def parse_urls(text: str) -> List[ParsedUrl]:
+    """Every supported link in text, in order, once per post even if it's linked in different ways."""
+    seen = set()
+    result = []
+    for url in extract_https_urls(text):
+        parsed = parse_url(url)
+        if not parsed:
+            continue
+
+        key = (parsed.platform, parsed.post_id if parsed.kind != "direct" else direct_url_id(url))
+        if key not in seen:
+            seen.add(key)
+            result.append(parsed)
+    return result
+
+
 def cleanup_mp4_url(url: str) -> str:
     return url.split('?')[0]
 
@@ -156,32 +274,6 @@ def check_if_mp4_url(url: str) -> bool:
     return False
 
 
-def check_if_mp4_url_is_larger_than_50mb(url: str) -> bool:
-    import urllib.request
-
-    req = urllib.request.Request(url, method='HEAD')
-
-    try:
-        with urllib.request.urlopen(req) as response:
-            content_length = response.getheader('Content-Length')
-
-            if content_length:
-                size_in_bytes = int(content_length)
-                size_in_mb = size_in_bytes / (1024 * 1024)
-
-                if size_in_mb > 50:
-                    return True
-                else:
-                    return False
-
-            else:
-                return True
-
-    except Exception as e:
-        logger.error(e)
-        return False
-
-
 def get_yt_video_id(url: str) -> str:
     if "youtu.be" in url:
         return re.search(r'youtu.be/(.{11})', url).group(1)
@@ -302,100 +394,234 @@ def get_filename(url: str, ext: str) -> str:
         return "-1"
 
 
+def get_parsed_filename(parsed: ParsedUrl, ext: str) -> str:
+    return parsed.post_id + "." + ext.lstrip(".")
+
+
 def get_description_tag(platform: str) -> str:
     return DESCRIPTION_TAGS.get(platform, "None")
 
 
+class VideoProbe(NamedTuple):
+    """Unprocessed yt-dlp metadata of a video, enough to pick a format and download it."""
+    video_id: str
+    info: dict
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.info.get("duration")
+
+    def fresh_info(self) -> dict:
+        """Copy of the info dict, yt-dlp modifies it while processing."""
+        return copy.deepcopy(self.info)
+
+
+def probe_video(url: str) -> VideoProbe:
+    """Extracts the metadata of a video once, later calls for the same video id are served from memory."""
+    parsed = parse_url(url)
+    video_id = parsed.post_id if parsed else url
+
+    probe = _probe_cache.get(video_id)
+    if probe is not None:
+        return probe
+
+    with engine.checkout("probe") as ydl:
+        # process=False keeps every format, the download picks its own through process_ie_result
+        info = ydl.extract_info(url, download=False, process=False)
+
+    probe = VideoProbe(video_id, info)
+    _probe_cache.put(video_id, probe)
+    return probe
+
+
+def estimate_format_size(fmt: dict, duration: Optional[float]) -> Optional[float]:
+    """Size of a format in bytes: exact if yt-dlp knows it, else bitrate times duration. None if unknown."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    if fmt.get("tbr") and duration:
+        return fmt["tbr"] * 1000 / 8 * duration  # tbr is in kbit/s
+    return None
+
+
+def _has_codec(fmt: dict, kind: str) -> bool:
+    return fmt.get(kind) != "none"  # Missing codec info means "maybe", like yt-dlp's own selectors
+
+
+def select_format(probe: VideoProbe, max_height: Optional[int] = None,
+                  max_size: int = MAX_FILE_SIZE) -> Optional[str]:
+    """Picks the best quality that fits max_size, mirroring the profiles' avc+m4a / mp4 preference.
+
+    Returns a yt-dlp format spec, or None when the sizes can't be estimated (the profile's format is used then).
+    Raises FileTooBigException when no quality fits.
+    """
+    formats = probe.info.get("formats") or []
+    duration = probe.duration
+
+    audio = [f for f in formats if f.get("ext") == "m4a" and not _has_codec(f, "vcodec") and _has_codec(f, "acodec")]
+    best_audio = max(audio, key=lambda f: f.get("tbr") or f.get("abr") or 0, default=None)
+    audio_size = estimate_format_size(best_audio, duration) if best_audio else None
+
+    ladder = []  # (quality, size, spec)
+    for f in formats:
+        if f.get("ext") != "mp4" or not _has_codec(f, "vcodec"):
+            continue
+        if max_height and (f.get("height") or 0) > max_height:
+            continue
+
+        size = estimate_format_size(f, duration)
+        quality = (f.get("height") or 0, f.get("tbr") or 0)
+        if not _has_codec(f, "acodec"):
+            if best_audio is None or not str(f.get("vcodec")).startswith("avc"):
+                continue
+            ladder.append((quality, size + audio_size if size and audio_size else None,
+                           f"{f['format_id']}+{best_audio['format_id']}"))
+        else:
+            ladder.append((quality, size, f["format_id"]))
+
+    known = [step for step in ladder if step[1] is not None]
+    if not known:
+        return None
+
+    fitting = [step for step in known if step[1] <= max_size]
+    if not fitting:
+        logger.info(f"{probe.video_id}: smallest format is {min(s for _, s, _ in known) / 1024 / 1024:.1f} MB")
+        raise exceptions.FileTooBigException()
+
+    return max(fitting, key=lambda step: step[0])[2]
+
+
+def _run_download(profile: str, link: str, path: str, probe: Optional[VideoProbe],
+                  format_spec: Optional[str] = None):
+    with engine.checkout(profile, path, format_spec) as ydl:
+        if probe is not None:
+            return ydl.process_ie_result(probe.fresh_info(), download=True)
+        return ydl.extract_info(link, download=True)
+
+
 def is_video_longer_than(url: str, time: int) -> bool:
-    ydl_opts = {
-        "quiet": True,  # Suppress output
-        "no_warnings": True,
-        "extract_flat": True,  # Faster metadata fetch
-        "cookiefile": "cookies.txt",
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            duration = info.get("duration")
-            if duration:
-                return duration > time
-            else:
-                return True  # Duration missing (livestreams)
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            return True
+    try:
+        duration = probe_video(url).duration
+        if duration:
+            return duration > time
+        else:
+            return True  # Duration missing (livestreams)
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return True
 
 
-def download_video(link: str, filename: str):
-    youtube_dl_options = {
-        "format": "bv[ext=mp4][vcodec^=avc]+ba[ext=m4a]/b[ext=mp4]",
-        "outtmpl": f"yt-dlp-downloads/{filename}",
-        "cookiefile": "cookies.txt",
-    }
-    with yt_dlp.YoutubeDL(youtube_dl_options) as ydl:
-        return ydl.download([link])
-
-
-def download_audio(link: str, filename: str):
-    youtube_dl_options = {
-        "format": "ba[ext=m4a]",
-        "outtmpl": f"yt-dlp-downloads/{filename}",
-        "cookiefile": "cookies.txt",
-        "writethumbnail": True,
-        "postprocessors": [
-            {
-                "key": "FFmpegMetadata",
-                "add_metadata": True,
-            },
-        ],
-        "keepvideo": True,
-    }
-    with yt_dlp.YoutubeDL(youtube_dl_options) as ydl:
-        info = ydl.extract_info(link, download=True)
-        return info
-
-
-def download_video_720(link: str, filename: str):
-    youtube_dl_options = {
-        "format": "bv[height<=720][ext=mp4][vcodec^=avc]+ba[ext=m4a]/b[ext=mp4][height<=720]",
-        "outtmpl": f"yt-dlp-downloads/{filename}",
-        "cookiefile": "cookies.txt",
-    }
-    with yt_dlp.YoutubeDL(youtube_dl_options) as ydl:
-        return ydl.download([link])
-
-
-def download_media(url: str):
-    global cindex
-    config.load()  # config file is in /etc/gallery-dl.conf or %APPDATA%\gallery-dl\config.json
-    if "instagram" in url:
-        cookies = os.listdir('igcookies')
-        cindex = cindex + 1
-        if cindex >= len(cookies):
-            cindex = 0
-        with open(f'./igcookies/{cookies[cindex]}', 'r') as cookiefile:
-            cstr = cookiefile.read()
-        logging.info(f'using cookie {cookies[cindex]}')
-        config.set(("extractor",), "cookies", f'./igcookies/{cookies[cindex]}')
+def download_video(link: str, path: str, probe: Optional[VideoProbe] = None):
+    # With a probe the format is picked from its metadata up front, so oversized videos are never downloaded
+    format_spec = select_format(probe) if probe is not None else None
+    return _run_download("video", link, path, probe, format_spec)
+
+
+def download_audio(link: str, path: str, probe: Optional[VideoProbe] = None):
+    return _run_download("audio", link, path, probe)
+
+
+def download_video_720(link: str, path: str, probe: Optional[VideoProbe] = None):
+    format_spec = select_format(probe, max_height=720) if probe is not None else None
+    return _run_download("video_720", link, path, probe, format_spec)
+
+
+def download_media(parsed: ParsedUrl, folder: str, max_total: Optional[int] = None):
+    """Downloads a post with gallery-dl, straight into folder, raising ScratchQuotaException past max_total bytes."""
+    import gallery_engine  # Pulls in gallery-dl, only loaded once it's needed
+
+    ig_cookie = None
+    if parsed.platform == "instagram":
+        ig_cookie = ig_cookies.acquire()
+
+    if ig_cookie:
+        cookies = ig_cookies.cookies_of(ig_cookie)  # Already parsed, no need to read the file again
     else:
-        config.set(("extractor",), "cookies", "cookies.txt")
-    config.set(("extractor",), "directory", [get_platform(url), get_platform_video_id(url)])
-    config.set(("extractor",), "filename", get_platform_video_id(url) + "_{num}.{extension}")
+        cookies = "cookies.txt"
+
+    # Everything is set on the job's own config, concurrent downloads don't see each other's settings
+    status = 1
+    try:
+        status = gallery_engine.run_download(parsed.canonical_url, {
+            ("extractor",): {
+                "cookies": cookies,
+                "base-directory": folder,
+                "directory": [],
+                "filename": parsed.post_id + "_{num}.{extension}",
+            },
+            ("postprocessor", "metadata"): {
+                "module": "metadata",
+                "event": "post",
+                "filename": parsed.post_id + ".txt",
+                "content": "{content or description}",
+            },
+        }, max_filesize=MAX_FILE_SIZE, max_total=max_total)
+    except (exceptions.FileTooBigException, exceptions.ScratchQuotaException):
+        status = 0  # The cookie did its job, the post is just too big
+        raise
+    finally:
+        if ig_cookie:
+            ig_cookies.report(ig_cookie, status == 0)
+
+
+def extract_audio(video_path: str, audio_path: str, info: dict) -> bool:
+    """Copies the audio track out of a downloaded video into an m4a, tagged like the audio profile does."""
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", video_path, "-vn", "-c:a", "copy",
+               "-metadata", f"title={info.get('track') or info.get('title') or ''}",
+               "-metadata", f"artist={info.get('artist') or info.get('uploader') or ''}",
+               audio_path]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=60)
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"Couldn't extract audio from {video_path}: {e}")
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        return False
+
+
+def download_thumbnail(info: dict, path_without_ext: str) -> Optional[str]:
+    """Fetches the thumbnail yt-dlp picked for a video, returns its path or None if there isn't one."""
+    url = info.get("thumbnail")
+    if not url:
+        return None
+
+    ext = os.path.splitext(urllib.parse.urlparse(url).path)[1] or ".jpg"
+    path = path_without_ext + ext
+    try:
+        httpclient.stream_to_file(url, path, 5 * 1024 * 1024)
+        return path
+    except Exception as e:
+        logger.error(f"Couldn't download thumbnail {url}: {e}")
+        return None
+
+
+def direct_url_id(url: str) -> str:
+    """Cache key of a direct link, which has no post id of its own."""
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def resolve_single_photo(parsed: ParsedUrl) -> Optional[tuple]:
+    """(url, size) of the file of a single image post, None if the post is anything else."""
+    import gallery_engine  # Pulls in gallery-dl, only loaded once it's needed
 
-    config.set(("postprocessor", "metadata"), "module", "metadata")
+    items = gallery_engine.extract_urls(parsed.canonical_url, {("extractor",): {"cookies": "cookies.txt"}})
+    if len(items) != 1:
+        return None
 
-    config.set(("postprocessor", "metadata"), "event", "post")
-    config.set(("postprocessor", "metadata"), "filename", get_platform_video_id(url) + ".txt")
-    config.set(("postprocessor", "metadata"), "content", "{content or description}")
+    url, kwdict = items[0]
+    if kwdict.get("extension") not in ["jpg", "jpeg", "png", "webp"]:
+        return None
+    return url, kwdict.get("file_size") or kwdict.get("size")
 
-    j = job.DownloadJob(url)
 
-    j.run()
+def download_direct_mp4(url: str, path: str) -> int:
+    """Streams a direct MP4 link to path, raises FileTooBigException as soon as it passes MAX_FILE_SIZE."""
+    return httpclient.stream_to_file(url, path, MAX_FILE_SIZE, ranged=True)
 
 
 def is_file_smaller_than_50mb(file_path: str) -> bool:
-    return os.path.getsize(file_path) < 50 * 1024 * 1024
+    return os.path.getsize(file_path) < MAX_FILE_SIZE
 
 
 def is_arr_smaller_than_50mb(files) -> bool:
@@ -0,0 +1,58 @@
+"""Posts fake Telegram message updates to a running webhook, for trying webhook mode locally.
+
+Usage: python tools/post_fake_update.py [--url URL] [--secret TOKEN] [--chat-id ID] [--count N] TEXT
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+def fake_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Test"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def post(url: str, update: dict, secret: str = None) -> int:
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    if secret:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("text", help="message text, e.g. a link to download")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", help="WEBHOOK_SECRET of the bot")
+    parser.add_argument("--chat-id", type=int, required=True, help="chat the bot will answer in")
+    parser.add_argument("--count", type=int, default=1, help="number of updates to post")
+    args = parser.parse_args()
+
+    first_id = int(time.time() * 1000) % 2 ** 31
+    start = time.perf_counter()
+    for i in range(args.count):
+        status = post(args.url, fake_update(first_id + i, args.chat_id, args.text), args.secret)
+        if status != 200:
+            print(f"update {first_id + i}: HTTP {status}")
+
+    elapsed = time.perf_counter() - start
+    print(f"posted {args.count} updates in {elapsed * 1000:.1f} ms ({elapsed / args.count * 1000:.2f} ms/ack)")
+
+
+if __name__ == "__main__":
+    main()
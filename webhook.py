@@ -0,0 +1,111 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import telebot
+from telebot.types import Update
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024  # Updates are a few KB, anything bigger isn't from Telegram
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def do_POST(self):
+        hook = self.server.hook
+        if self.path != hook.path:
+            self.send_error(404)
+            return
+
+        if hook.secret_token and not hmac.compare_digest(
+                self.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), hook.secret_token):
+            self.send_error(403)
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_BODY_SIZE:
+            self.send_error(400)
+            return
+
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_error(400)
+            return
+
+        try:
+            hook.updates.put_nowait(update)
+        except queue.Full:
+            self.send_error(503)  # Telegram retries later
+            return
+
+        # Acknowledged before any processing, Telegram never waits on our handlers
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    hook: "WebhookServer"
+
+
+class WebhookServer:
+    """Receives Telegram updates over HTTP and hands them to the bot's handlers from a queue."""
+
+    def __init__(self, bot: telebot.TeleBot, host: str = "0.0.0.0", port: int = 8443, path: str = "/telegram",
+                 secret_token: Optional[str] = None, queue_size: int = 1000, dispatchers: int = 2):
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.updates = queue.Queue(maxsize=queue_size)
+        self.dispatchers = dispatchers
+
+        self._server = _Server((host, port), _Handler)
+        self._server.hook = self
+        self._threads = []
+
+    @property
+    def port(self) -> int:
+        return self._server.server_port
+
+    def _dispatch(self):
+        while True:
+            update = self.updates.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([Update.de_json(update)])
+            except Exception as e:
+                logger.error(f"Error processing update {update.get('update_id')}: {e}")
+
+    def start(self):
+        """Serves in the background."""
+        for i in range(self.dispatchers):
+            thread = threading.Thread(target=self._dispatch, name=f"webhook-dispatch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(target=self._server.serve_forever, name="webhook-server", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def serve_forever(self):
+        self.start()
+        logger.info(f"Webhook listening on port {self.port}, path {self.path}")
+        self._threads[-1].join()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        for _ in range(self.dispatchers):
+            self.updates.put(None)
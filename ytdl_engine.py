@@ -0,0 +1,113 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+COOKIE_FILE = "cookies.txt"
+
+# Option profiles, every profile gets its own pool of warm YoutubeDL instances
+PROFILES = {
+    "probe": {
+        "quiet": True,  # Suppress output
+        "no_warnings": True,
+        "cookiefile": COOKIE_FILE,
+    },
+    "video": {
+        "format": "bv[ext=mp4][vcodec^=avc]+ba[ext=m4a]/b[ext=mp4]",
+        "cookiefile": COOKIE_FILE,
+    },
+    "video_720": {
+        "format": "bv[height<=720][ext=mp4][vcodec^=avc]+ba[ext=m4a]/b[ext=mp4][height<=720]",
+        "cookiefile": COOKIE_FILE,
+    },
+    "audio": {
+        "format": "ba[ext=m4a]",
+        "cookiefile": COOKIE_FILE,
+        "writethumbnail": True,
+        "postprocessors": [
+            {
+                "key": "FFmpegMetadata",
+                "add_metadata": True,
+            },
+        ],
+        "keepvideo": True,
+    },
+}
+
+
+class YtdlEngine:
+    """Keeps warm YoutubeDL instances around instead of building one per call.
+
+    Building a YoutubeDL loads the cookie file and sets up extractors and HTTP handlers, a warm instance
+    keeps all of that (including its pooled connections) between downloads. Instances aren't thread safe,
+    so each one is only handed to one worker at a time.
+    """
+
+    def __init__(self, profiles: Dict[str, dict], max_idle: int = 4):
+        self.profiles = profiles
+        self.max_idle = max_idle
+        self.created = 0
+        self._idle: Dict[str, List["yt_dlp.YoutubeDL"]] = {name: [] for name in profiles}
+        self._lock = threading.Lock()
+
+    def _create(self, profile: str) -> "yt_dlp.YoutubeDL":
+        import yt_dlp  # Slow to import, only loaded once the first download needs it
+
+        ydl = yt_dlp.YoutubeDL(dict(self.profiles[profile]))
+        with self._lock:
+            self.created += 1
+        return ydl
+
+    @contextmanager
+    def checkout(self, profile: str, outtmpl: Optional[str] = None, format_spec: Optional[str] = None):
+        """Lends a YoutubeDL of the given profile, writing downloads to outtmpl.
+
+        format_spec replaces the profile's format for this checkout only.
+        """
+        with self._lock:
+            idle = self._idle[profile]
+            ydl = idle.pop() if idle else None
+
+        if ydl is None:
+            ydl = self._create(profile)
+
+        if outtmpl is not None:
+            ydl.params["outtmpl"]["default"] = outtmpl
+
+        # The selector is compiled once in __init__, so that's what has to be swapped
+        profile_selector = ydl.format_selector
+        if format_spec is not None:
+            ydl.format_selector = ydl.build_format_selector(format_spec)
+
+        try:
+            yield ydl
+        finally:
+            ydl.format_selector = profile_selector
+            with self._lock:
+                idle = self._idle[profile]
+                if len(idle) < self.max_idle:
+                    idle.append(ydl)
+                    ydl = None
+            if ydl is not None:
+                ydl.close()
+
+    def close(self):
+        """Closes every idle instance, this also writes back updated cookies."""
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            for idle in self._idle.values():
+                idle.clear()
+
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.error(f"Error closing yt-dlp instance: {e}")
+
+
+engine = YtdlEngine(PROFILES)